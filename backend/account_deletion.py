@@ -0,0 +1,164 @@
+from datetime import datetime
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.exc import IntegrityError
+import logging
+import os
+import secrets
+import time
+
+from content_stats import apply_rating_change
+from database import (
+    SessionLocal, AccountDeletion, User, Favorite, History, Rating, Follow, Activity,
+    LibraryChange, LibraryVersion
+)
+import metrics
+import review_search
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("ACCOUNT_DELETION_BATCH_SIZE", "500"))
+# Pause between batches so other writers to the same tables get the locks
+PAUSE_SECONDS = float(os.getenv("ACCOUNT_DELETION_PAUSE", "0.05"))
+# Seconds one scheduler run may spend before yielding to the other jobs
+RUN_SECONDS = float(os.getenv("ACCOUNT_DELETION_RUN_SECONDS", "20"))
+INTERVAL = float(os.getenv("ACCOUNT_DELETION_INTERVAL", "30"))
+# Independent of SCHEDULER_ENABLED, which only turns off cache warming;
+# with this off, run `manage.py delete-accounts` instead
+ENABLED = os.getenv("ACCOUNT_DELETION_ENABLED", "1") == "1"
+
+# (name, model, rows of user_id) in deletion order; ratings first so the
+# community stats stop counting a deleted user as early as possible
+PHASES = (
+    ("ratings", Rating, lambda user_id: Rating.user_id == user_id),
+    ("favorites", Favorite, lambda user_id: Favorite.user_id == user_id),
+    ("history", History, lambda user_id: History.user_id == user_id),
+    ("activities", Activity, lambda user_id: or_(Activity.user_id == user_id, Activity.target_user_id == user_id)),
+    ("follows", Follow, lambda user_id: or_(Follow.follower_id == user_id, Follow.following_id == user_id)),
+    ("library_changes", LibraryChange, lambda user_id: LibraryChange.user_id == user_id),
+)
+
+
+def request_deletion(db, user):
+    """Tombstone user and queue the deletion of their rows; returns the job.
+
+    The email and username are released right away, which also invalidates
+    every token issued for the account (tokens carry the email). The rows
+    themselves are removed in the background by run_pending(). Raises
+    IntegrityError if the tombstone collides with another account.
+    """
+    job = db.query(AccountDeletion).filter(
+        AccountDeletion.user_id == user.id, AccountDeletion.status != "done"
+    ).first()
+    if job is not None:
+        return job
+
+    total = sum(
+        db.query(func.count(model.id)).filter(rows(user.id)).scalar()
+        for _, model, rows in PHASES
+    )
+    job = AccountDeletion(
+        id=secrets.token_urlsafe(16), user_id=user.id, status="pending", total_rows=total, deleted_rows=0
+    )
+    db.add(job)
+    user.email = f"deleted-{user.id}@deleted.invalid"  # signup rejects .invalid addresses
+    # Random rather than derived from the id, which anyone could register first
+    user.username = f"deleted-{job.id}"
+    user.hashed_password = ""
+    user.bio = None
+    user.avatar_url = None
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise
+    return job
+
+
+def progress(job):
+    percent = 100.0 if job.status == "done" else (
+        min(99.0, round(100.0 * job.deleted_rows / job.total_rows, 1)) if job.total_rows else 0.0
+    )
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "phase": job.phase,
+        "deleted_rows": job.deleted_rows,
+        "total_rows": job.total_rows,
+        "percent": percent,
+        "requested_at": job.requested_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def _delete_batch(db, user_id, model, rows):
+    """Delete up to BATCH_SIZE rows of model; returns how many went"""
+    ids = db.execute(select(model.id).where(rows(user_id)).limit(BATCH_SIZE)).scalars().all()
+    if not ids:
+        return 0
+    statement = delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+    if model is not Rating:
+        return db.execute(statement).rowcount
+
+    # Only ratings this transaction actually removed are taken out of the
+    # stats, so two runners on one job cannot subtract a rating twice
+    removed = db.execute(
+        statement.returning(Rating.id, Rating.content_type, Rating.content_id, Rating.rating)
+    ).all()
+    for _, content_type, content_id, value in removed:
+        apply_rating_change(db, content_type, content_id, old=value)
+    review_search.unindex_ratings(db, [row[0] for row in removed])
+    return len(removed)
+
+
+def _run_job(db, job, deadline):
+    """Work on job until it is done (True) or the deadline passes (False)"""
+    if job.status == "pending":
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        db.commit()
+
+    for name, model, rows in PHASES:
+        while True:
+            if time.monotonic() > deadline:
+                return False
+            deleted = _delete_batch(db, job.user_id, model, rows)
+            if not deleted:
+                break
+            job.phase = name
+            job.deleted_rows += deleted
+            db.commit()  # one short transaction per batch, progress included
+            metrics.ACCOUNT_DELETION_ROWS.inc(name, amount=deleted)
+            time.sleep(PAUSE_SECONDS)
+
+    # Anything written for the user while the phases ran fails this
+    # transaction on the foreign keys; the next run sweeps it up
+    db.execute(delete(LibraryVersion).where(LibraryVersion.user_id == job.user_id))
+    db.execute(delete(User).where(User.id == job.user_id))
+    job.status = "done"
+    job.phase = None
+    job.error = None
+    job.finished_at = datetime.utcnow()
+    db.commit()
+    logger.info("Deleted account %d (%d rows)", job.user_id, job.deleted_rows)
+    return True
+
+
+def run_pending(budget=RUN_SECONDS):
+    """Advance queued deletions, oldest first, for at most budget seconds"""
+    deadline = time.monotonic() + budget
+    db = SessionLocal()
+    try:
+        jobs = db.query(AccountDeletion).filter(
+            AccountDeletion.status != "done"
+        ).order_by(AccountDeletion.requested_at).all()
+        for job in jobs:
+            try:
+                if not _run_job(db, job, deadline):
+                    return
+            except Exception as exc:
+                db.rollback()
+                logger.exception("Account deletion %s failed; will retry", job.id)
+                job.error = str(exc)[:1000]
+                db.commit()
+    finally:
+        db.close()
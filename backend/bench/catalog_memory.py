@@ -0,0 +1,93 @@
+"""Compare the memory held by raw detail payloads with CatalogEntry objects.
+
+Builds detail payloads shaped like TMDB/Jikan responses (the same
+generators bench.fake_upstream serves), round-trips each through JSON so
+strings are not shared the way literals would be, and measures allocated
+memory with tracemalloc:
+
+    python -m bench.catalog_memory --entries 100000
+
+Raw dicts for 100k titles take several GB, so by default they are measured
+on --raw-sample titles and scaled up; pass --raw-sample equal to --entries
+on a machine with enough memory to measure them directly. Generating the
+payloads under tracemalloc is slow; 100k titles take several minutes.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Share of each content type in the cache, roughly what the detail routes see
+MIX = (("movies", 45), ("tv", 35), ("anime", 20))
+
+
+def payloads(count):
+    """(content_type, parsed payload) for count titles in the MIX proportions"""
+    from bench.fake_upstream import _tmdb_detail, _jikan_item
+
+    for index in range(count):
+        slot = index % 100
+        if slot < MIX[0][1]:
+            content_type, payload = "movies", _tmdb_detail("movie", index)
+        elif slot < MIX[0][1] + MIX[1][1]:
+            content_type, payload = "tv", _tmdb_detail("tv", index)
+        else:
+            content_type, payload = "anime", {"data": _jikan_item(index)}
+        yield content_type, json.loads(json.dumps(payload))
+
+
+def measure(build):
+    """(bytes still allocated by build()'s result, seconds, result)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark catalog entry memory")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--raw-sample", type=int, default=5000)
+    args = parser.parse_args()
+    sys.path.insert(0, BACKEND_DIR)
+
+    from catalog_entry import from_payload
+
+    raw_count = min(args.raw_sample, args.entries)
+    raw_size, _, raw = measure(lambda: list(payloads(raw_count)))
+    # Same payloads converted, to check nothing the frontend reads is lost
+    for content_type, payload in raw[:200]:
+        rebuilt = from_payload(content_type, payload).to_payload()
+        if content_type == "anime":
+            assert rebuilt["data"]["images"] == payload["data"]["images"]
+        else:
+            assert rebuilt["credits"]["cast"][:6] == payload["credits"]["cast"][:6]
+    del raw
+
+    def build_entries():
+        # Raw payloads are dropped as soon as they are converted, as in the cache
+        return [from_payload(content_type, payload) for content_type, payload in payloads(args.entries)]
+
+    compact_size, elapsed, entries = measure(build_entries)
+    raw_total = raw_size * args.entries / raw_count
+    scaled = "" if raw_count == args.entries else f" (measured on {raw_count}, scaled)"
+
+    print(f"{len(entries)} titles ({', '.join(f'{share}% {name}' for name, share in MIX)})")
+    print(f"raw dicts:      {raw_total / 2 ** 20:10.1f} MiB  {raw_total / args.entries:8.0f} B/title{scaled}")
+    print(f"CatalogEntry:   {compact_size / 2 ** 20:10.1f} MiB  {compact_size / args.entries:8.0f} B/title")
+    print(f"reduction:      {raw_total / compact_size:10.1f}x")
+    print(f"build + convert: {elapsed:9.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Local stand-in for the TMDB and Jikan APIs.
+
+Serves deterministic payloads shaped like the real responses under
+/tmdb/3/... and /jikan/v4/..., with configurable latency and a per-API rate
+limit that answers 429 with Retry-After, so the backend can be benchmarked
+without touching the real services:
+
+    python -m bench.fake_upstream --port 8765 --latency-ms 80 --jitter-ms 40
+
+then start the API with TMDB_BASE_URL=http://127.0.0.1:8765/tmdb/3 and
+JIKAN_BASE_URL=http://127.0.0.1:8765/jikan/v4.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import argparse
+import json
+import random
+import re
+import threading
+import time
+
+PAGE_SIZE = 20
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Returns 0 if a token was taken, else seconds until one is available"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+# ====================== PAYLOADS ======================
+
+def _tmdb_item(kind, item_id):
+    rng = random.Random(f"{kind}-{item_id}")
+    item = {
+        "id": item_id,
+        "overview": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 3,
+        "poster_path": f"/poster{item_id}.jpg",
+        "backdrop_path": f"/backdrop{item_id}.jpg",
+        "vote_average": round(rng.uniform(4, 9.5), 1),
+        "vote_count": rng.randint(10, 30000),
+        "popularity": round(rng.uniform(1, 500), 3),
+        "genre_ids": rng.sample([28, 12, 16, 35, 80, 18, 14, 27, 9648, 10749, 878, 53], 3),
+        "original_language": rng.choice(["en", "ja", "ko", "fr", "es"]),
+    }
+    if kind == "movie":
+        item.update(title=f"Movie {item_id}", release_date=f"{rng.randint(1970, 2024)}-06-01")
+    else:
+        item.update(name=f"Show {item_id}", first_air_date=f"{rng.randint(1970, 2024)}-06-01")
+    return item
+
+
+def _tmdb_page(kind, page, seed=""):
+    rng = random.Random(f"{kind}-{page}-{seed}")
+    ids = [rng.randint(1, 50000) for _ in range(PAGE_SIZE)]
+    return {
+        "page": page,
+        "results": [_tmdb_item(kind, i) for i in ids],
+        "total_pages": 500,
+        "total_results": 500 * PAGE_SIZE,
+    }
+
+
+def _tmdb_detail(kind, item_id):
+    detail = _tmdb_item(kind, item_id)
+    detail.update(
+        genres=[{"id": g, "name": f"Genre {g}"} for g in detail["genre_ids"]],
+        runtime=118,
+        credits={
+            "cast": [{"id": i, "name": f"Actor {i}", "character": f"Role {i}", "profile_path": f"/p{i}.jpg"}
+                     for i in range(40)],
+            "crew": [{"id": i, "name": f"Crew {i}", "job": "Producer"} for i in range(60)],
+        },
+        videos={"results": [{"key": f"vid{i}", "site": "YouTube", "type": "Trailer"} for i in range(5)]},
+        similar=_tmdb_page(kind, 1, seed=str(item_id)),
+    )
+    return detail
+
+
+def _jikan_item(mal_id):
+    rng = random.Random(f"anime-{mal_id}")
+    year = rng.randint(1970, 2024)
+    return {
+        "mal_id": mal_id,
+        "title": f"Anime {mal_id}",
+        "title_english": f"Anime {mal_id}",
+        "images": {"jpg": {
+            "image_url": f"https://cdn.example/{mal_id}.jpg",
+            "large_image_url": f"https://cdn.example/{mal_id}l.jpg",
+        }},
+        "score": round(rng.uniform(5, 9.3), 2),
+        "scored_by": rng.randint(100, 2000000),
+        "year": year,
+        "aired": {"from": f"{year}-04-01T00:00:00+00:00"},
+        "episodes": rng.randint(1, 60),
+        "synopsis": "Lorem ipsum dolor sit amet. " * 6,
+        "genres": [{"mal_id": g, "name": f"Genre {g}"} for g in rng.sample([1, 2, 4, 8, 10, 14, 22, 24], 2)],
+    }
+
+
+def _jikan_page(page, seed=""):
+    rng = random.Random(f"anime-{page}-{seed}")
+    return {
+        "pagination": {"last_visible_page": 500, "has_next_page": True, "current_page": page},
+        "data": [_jikan_item(rng.randint(1, 50000)) for _ in range(PAGE_SIZE)],
+    }
+
+
+def route(path, query):
+    """Map an upstream path to a payload; returns None for unknown paths"""
+    page = int(query.get("page", ["1"])[0])
+    seed = json.dumps(sorted(query.items()))
+
+    match = re.fullmatch(r"/tmdb/3/(movie|tv)/(\d+)", path)
+    if match:
+        return _tmdb_detail(match.group(1), int(match.group(2)))
+    match = re.fullmatch(r"/tmdb/3/(?:trending|search|discover)/(movie|tv)(?:/week)?", path)
+    if match:
+        return _tmdb_page(match.group(1), page, seed)
+    match = re.fullmatch(r"/tmdb/3/genre/(movie|tv)/list", path)
+    if match:
+        return {"genres": [{"id": g, "name": f"Genre {g}"} for g in (28, 12, 16, 35, 80, 18, 14, 27)]}
+
+    match = re.fullmatch(r"/jikan/v4/anime/(\d+)/full", path)
+    if match:
+        return {"data": _jikan_item(int(match.group(1)))}
+    if path in ("/jikan/v4/anime", "/jikan/v4/top/anime"):
+        return _jikan_page(page, seed)
+    return None
+
+
+# ====================== SERVER ======================
+
+def make_handler(latency_ms, jitter_ms, limiters):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            api = parsed.path.split("/")[1]
+            limiter = limiters.get(api)
+            retry_after = limiter.take() if limiter else 0
+            if retry_after:
+                self._send(429, {"status": 429, "message": "Too Many Requests"},
+                           {"Retry-After": str(max(1, round(retry_after)))})
+                return
+
+            time.sleep(max(0.0, random.gauss(latency_ms, jitter_ms)) / 1000)
+            payload = route(parsed.path, parse_qs(parsed.query))
+            if payload is None:
+                self._send(404, {"status_message": "The resource you requested could not be found."})
+            else:
+                self._send(200, payload)
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start(port=0, latency_ms=50.0, jitter_ms=20.0, tmdb_rps=40.0, jikan_rps=3.0):
+    """Start the fake upstream in a background thread; returns the server"""
+    limiters = {
+        "tmdb": TokenBucket(tmdb_rps, tmdb_rps) if tmdb_rps else None,
+        "jikan": TokenBucket(jikan_rps, jikan_rps) if jikan_rps else None,
+    }
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency_ms, jitter_ms, limiters))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-upstream", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--tmdb-rps", type=float, default=40.0, help="0 disables the limit")
+    parser.add_argument("--jikan-rps", type=float, default=3.0, help="0 disables the limit")
+    args = parser.parse_args()
+
+    server = start(args.port, args.latency_ms, args.jitter_ms, args.tmdb_rps, args.jikan_rps)
+    print(f"Fake TMDB/Jikan listening on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Load-test the API against a seeded database and a fake upstream.
+
+Seeds a database, starts bench.fake_upstream in-process and the app under
+uvicorn in a subprocess, drives a weighted mix of realistic page loads from
+concurrent clients and reports throughput and p50/p95/p99 per route:
+
+    python -m bench.run --users 500 --duration 30 --concurrency 16
+    python -m bench.run --json current.json --baseline main.json --max-regression 0.2
+
+With --baseline the run exits non-zero if any route's p95 regressed by more
+than --max-regression, so it can gate a deploy.
+"""
+from collections import defaultdict
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEARCH_TERMS = ("star", "love", "night", "dragon", "city", "ghost", "war", "summer")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ====================== TRAFFIC MIX ======================
+
+class Client:
+    """One simulated user session; records latency per route template"""
+
+    def __init__(self, base_url, token, results, rng, catalog_size):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+        self.results = results
+        self.rng = rng
+        self.catalog_size = catalog_size
+
+    def call(self, method, label, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        self.results.append((f"{method} {label}", time.perf_counter() - start, ok))
+
+    def home_page(self):
+        self.call("GET", "/trending-movies", "/trending-movies")
+        self.call("GET", "/trending-tv", "/trending-tv")
+        self.call("GET", "/trending-anime", "/trending-anime")
+        self.call("GET", "/history", "/history")
+
+    def search(self):
+        term = self.rng.choice(SEARCH_TERMS)
+        if self.rng.random() < 0.7:
+            self.call("GET", "/search-movies", "/search-movies", params={"query": term})
+        else:
+            self.call("GET", "/search-anime", "/search-anime", params={"query": term})
+
+    def _pick_content(self):
+        content_type = self.rng.choice(("movies", "tv", "anime"))
+        return content_type, str(self.rng.randint(1, self.catalog_size))
+
+    def detail_page(self):
+        content_type, content_id = self._pick_content()
+        route = {"movies": "/movie", "tv": "/tv", "anime": "/anime"}[content_type]
+        self.call("GET", f"{route}/{{id}}", f"{route}/{content_id}")
+        entry = {"content_type": content_type, "content_id": content_id, "title": f"Title {content_id}"}
+        self.call("POST", "/history", "/history", json=entry)
+        self.call("GET", "/favorites/check/{type}/{id}", f"/favorites/check/{content_type}/{content_id}")
+        self.call("GET", "/ratings/{type}/{id}", f"/ratings/{content_type}/{content_id}")
+
+    def rate(self):
+        content_type, content_id = self._pick_content()
+        self.call("POST", "/ratings", "/ratings", json={
+            "content_type": content_type, "content_id": content_id, "title": f"Title {content_id}",
+            "rating": float(self.rng.randint(1, 10)), "review": "Benchmark review"
+        })
+
+    def feed(self):
+        self.call("GET", "/feed", "/feed")
+
+
+SCENARIOS = (
+    (Client.home_page, 30),
+    (Client.search, 15),
+    (Client.detail_page, 30),
+    (Client.rate, 10),
+    (Client.feed, 15),
+)
+
+
+def drive(base_url, tokens, duration, concurrency, catalog_size, seed=1):
+    results = []
+    deadline = time.monotonic() + duration
+    actions, weights = zip(*SCENARIOS)
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        local = []
+        while time.monotonic() < deadline:
+            client = Client(base_url, rng.choice(tokens), local, rng, catalog_size)
+            for _ in range(rng.randint(3, 8)):
+                if time.monotonic() >= deadline:
+                    break
+                rng.choices(actions, weights)[0](client)
+        results.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results, duration):
+    by_route = defaultdict(list)
+    errors = defaultdict(int)
+    for label, elapsed, ok in results:
+        by_route[label].append(elapsed)
+        if not ok:
+            errors[label] += 1
+
+    summary = {"duration": duration, "requests": len(results), "throughput": len(results) / duration, "routes": {}}
+    for label, timings in sorted(by_route.items()):
+        timings.sort()
+        summary["routes"][label] = {
+            "count": len(timings),
+            "errors": errors[label],
+            "rps": len(timings) / duration,
+            "p50_ms": percentile(timings, 0.50) * 1000,
+            "p95_ms": percentile(timings, 0.95) * 1000,
+            "p99_ms": percentile(timings, 0.99) * 1000,
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n{summary['requests']} requests in {summary['duration']:.0f}s "
+          f"({summary['throughput']:.1f} req/s)\n")
+    print(f"{'route':<38} {'count':>7} {'err':>5} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, row in summary["routes"].items():
+        print(f"{label:<38} {row['count']:>7} {row['errors']:>5} {row['rps']:>7.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+
+
+def compare(summary, baseline, max_regression):
+    """Returns the routes whose p95 regressed beyond max_regression"""
+    regressions = []
+    for label, row in summary["routes"].items():
+        before = baseline["routes"].get(label)
+        if before and before["p95_ms"] > 0 and row["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append((label, before["p95_ms"], row["p95_ms"]))
+    return regressions
+
+
+# ====================== ORCHESTRATION ======================
+
+def _wait_until_ready(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API server exited during startup")
+        try:
+            if requests.get(base_url + "/", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("API server did not become ready")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MediaMingle API")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--reset", action="store_true", help="drop tables before seeding --database-url")
+    parser.add_argument("--no-seed", action="store_true", help="reuse an already seeded database")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--follows", type=int, default=20)
+    parser.add_argument("--ratings", type=int, default=50)
+    parser.add_argument("--favorites", type=int, default=15)
+    parser.add_argument("--history", type=int, default=30)
+    parser.add_argument("--catalog-size", type=int, default=5000)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of measured traffic")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of unmeasured traffic")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="fake upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--tmdb-rps", type=float, default=40.0)
+    parser.add_argument("--jikan-rps", type=float, default=3.0)
+    parser.add_argument("--json", help="write the summary to this file")
+    parser.add_argument("--baseline", help="summary JSON from a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mediamingle-bench-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["DATABASE_URL"] = database_url
+    # Everything the server persists outside the database goes in the workdir
+    # too, so a run never touches the real snapshot or starts with a warm cache
+    os.environ.update(
+        SNAPSHOT_PATH=os.path.join(workdir, "catalog_snapshot.json.gz"),
+        CACHE_L2_PATH=os.path.join(workdir, "cache.sqlite3"),
+        SCHEDULER_LOCK_PATH=os.path.join(workdir, "scheduler.lock"),
+        IMAGE_CACHE_DIR=os.path.join(workdir, "img"),
+        PROFILING_DIR=os.path.join(workdir, "profiles"),
+        # Every client connects from 127.0.0.1 and would share one IP budget
+        RATE_LIMIT_ENABLED="0",
+    )
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    sys.path.insert(0, BACKEND_DIR)
+
+    from auth import create_access_token
+    from bench import fake_upstream
+    from bench.seed import seed
+
+    if args.no_seed:
+        from database import SessionLocal, User
+        db = SessionLocal()
+        usernames = [u for (u,) in db.query(User.username).limit(args.users).all()]
+        db.close()
+    else:
+        print("Seeding database...")
+        usernames = seed(args.users, args.follows, args.ratings, args.favorites, args.history,
+                         args.catalog_size, reset=args.reset or not args.database_url)
+    tokens = [create_access_token({"sub": f"{name}@bench.local"}) for name in usernames]
+
+    upstream = fake_upstream.start(0, args.latency_ms, args.jitter_ms, args.tmdb_rps, args.jikan_rps)
+    upstream_url = f"http://127.0.0.1:{upstream.server_port}"
+
+    port = _free_port()
+    env = dict(os.environ,
+               TMDB_API_KEY="benchmark",
+               TMDB_BASE_URL=f"{upstream_url}/tmdb/3",
+               JIKAN_BASE_URL=f"{upstream_url}/jikan/v4")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_ready(base_url, server)
+        if args.warmup:
+            print(f"Warming up for {args.warmup:.0f}s...")
+            drive(base_url, tokens, args.warmup, args.concurrency, args.catalog_size, seed=2)
+        print(f"Measuring for {args.duration:.0f}s with {args.concurrency} clients...")
+        results = drive(base_url, tokens, args.duration, args.concurrency, args.catalog_size)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        upstream.shutdown()
+
+    summary = summarize(results, args.duration)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f), args.max_regression)
+        for label, before, after in regressions:
+            print(f"REGRESSION {label}: p95 {before:.1f} ms -> {after:.1f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
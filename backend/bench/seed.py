@@ -0,0 +1,129 @@
+"""Fill a database with synthetic users, follows, ratings and activity.
+
+Reads DATABASE_URL like the app does:
+
+    DATABASE_URL=sqlite:///bench.db python -m bench.seed --users 2000 --reset
+"""
+from datetime import datetime, timedelta
+import argparse
+import random
+import time
+
+CONTENT_TYPES = ("movies", "tv", "anime")
+PASSWORD = "benchmark"
+CHUNK = 5000
+
+
+def _insert(db, model, rows):
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), CHUNK):
+        db.execute(insert(model), rows[start:start + CHUNK])
+
+
+def seed(users=1000, follows=20, ratings=50, favorites=15, history=30, catalog_size=5000,
+         reset=False, rng_seed=42):
+    """Insert synthetic data; returns the usernames created"""
+    from auth import get_password_hash
+    from database import Base, SessionLocal, get_engine, init_db, User, Favorite, History, Rating, Follow, Activity
+    import content_stats
+    import review_search
+
+    rng = random.Random(rng_seed)
+    if reset:
+        Base.metadata.drop_all(bind=get_engine())
+    init_db()
+
+    now = datetime.utcnow()
+    hashed = get_password_hash(PASSWORD)  # bcrypt is slow; every user shares one hash
+    db = SessionLocal()
+    try:
+        first_id = (db.query(User.id).order_by(User.id.desc()).limit(1).scalar() or 0) + 1
+        user_ids = list(range(first_id, first_id + users))
+        usernames = [f"bench{uid}" for uid in user_ids]
+        _insert(db, User, [
+            {"id": uid, "email": f"{name}@bench.local", "username": name,
+             "hashed_password": hashed, "created_at": now - timedelta(days=rng.randint(0, 365))}
+            for uid, name in zip(user_ids, usernames)
+        ])
+
+        follow_rows, favorite_rows, history_rows, rating_rows, activity_rows = [], [], [], [], []
+
+        def content():
+            content_type = rng.choice(CONTENT_TYPES)
+            content_id = str(rng.randint(1, catalog_size))
+            return content_type, content_id, f"{content_type.title()} {content_id}", f"/poster{content_id}.jpg"
+
+        for uid in user_ids:
+            for target in rng.sample(user_ids, min(follows, users - 1)):
+                if target == uid:
+                    continue
+                created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                follow_rows.append({"follower_id": uid, "following_id": target, "created_at": created})
+                activity_rows.append({"user_id": uid, "activity_type": "follow", "target_user_id": target,
+                                      "target_username": f"bench{target}", "created_at": created})
+
+            seen = set()
+            for _ in range(ratings):
+                content_type, content_id, title, poster = content()
+                if (content_type, content_id) in seen:
+                    continue
+                seen.add((content_type, content_id))
+                created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                score = float(rng.randint(1, 10))
+                rating_rows.append({"user_id": uid, "content_type": content_type, "content_id": content_id,
+                                    "title": title, "poster_url": poster, "rating": score,
+                                    "review": "Solid watch. " * rng.randint(0, 8) or None, "rated_at": created})
+                activity_rows.append({"user_id": uid, "activity_type": "rating", "content_type": content_type,
+                                      "content_id": content_id, "content_title": title,
+                                      "content_poster": poster, "rating_value": score, "created_at": created})
+
+            for _ in range(favorites):
+                content_type, content_id, title, poster = content()
+                created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                favorite_rows.append({"user_id": uid, "content_type": content_type, "content_id": content_id,
+                                      "title": title, "poster_url": poster, "added_at": created})
+                activity_rows.append({"user_id": uid, "activity_type": "favorite", "content_type": content_type,
+                                      "content_id": content_id, "content_title": title,
+                                      "content_poster": poster, "created_at": created})
+
+            for _ in range(history):
+                content_type, content_id, title, poster = content()
+                history_rows.append({"user_id": uid, "content_type": content_type, "content_id": content_id,
+                                     "title": title, "poster_url": poster,
+                                     "viewed_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))})
+
+        _insert(db, Follow, follow_rows)
+        _insert(db, Rating, rating_rows)
+        _insert(db, Favorite, favorite_rows)
+        _insert(db, History, history_rows)
+        activity_rows.sort(key=lambda row: row["created_at"])
+        _insert(db, Activity, activity_rows)
+        db.commit()
+        # Bulk inserts bypass the rating write paths
+        content_stats.recompute(db)
+        review_search.rebuild(db)
+        return usernames
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a MediaMingle database with synthetic data")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--follows", type=int, default=20, help="follows per user")
+    parser.add_argument("--ratings", type=int, default=50, help="ratings per user")
+    parser.add_argument("--favorites", type=int, default=15, help="favorites per user")
+    parser.add_argument("--history", type=int, default=30, help="history rows per user")
+    parser.add_argument("--catalog-size", type=int, default=5000, help="distinct content ids per type")
+    parser.add_argument("--reset", action="store_true", help="drop all tables first")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    usernames = seed(args.users, args.follows, args.ratings, args.favorites, args.history,
+                     args.catalog_size, args.reset)
+    print(f"Seeded {len(usernames)} users in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
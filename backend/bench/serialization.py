@@ -0,0 +1,79 @@
+"""Compare the ORM + response_model path with the column/orjson path.
+
+Seeds one user with many ratings into a throwaway SQLite database and times
+both ways of producing the /ratings response body:
+
+    python -m bench.serialization --ratings 5000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark list response serialization")
+    parser.add_argument("--ratings", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mediamingle-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    sys.path.insert(0, BACKEND_DIR)
+
+    from typing import List
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    import orjson
+
+    from bench.seed import seed
+    from database import SessionLocal, Rating
+    from schemas import RatingResponse
+    from serialization import response_fields, columns
+
+    seed(users=1, follows=0, ratings=args.ratings, favorites=0, history=0,
+         catalog_size=args.ratings * 10, reset=True)
+    fields = response_fields(RatingResponse)
+    adapter = TypeAdapter(List[RatingResponse])
+    db = SessionLocal()
+
+    def orm_path():
+        rows = db.query(Rating).filter(Rating.user_id == 1).order_by(Rating.rated_at.desc()).all()
+        validated = adapter.validate_python(rows, from_attributes=True)
+        body = json.dumps(jsonable_encoder(validated)).encode()
+        db.expunge_all()
+        return body
+
+    def column_path():
+        rows = db.query(*columns(Rating, fields)).filter(
+            Rating.user_id == 1
+        ).order_by(Rating.rated_at.desc()).all()
+        return orjson.dumps([dict(zip(fields, row)) for row in rows])
+
+    assert json.loads(orm_path()) == json.loads(column_path())
+    count = db.query(Rating).count()
+    before = best_of(orm_path, args.repeat)
+    after = best_of(column_path, args.repeat)
+    db.close()
+
+    print(f"{count} ratings, best of {args.repeat}")
+    print(f"ORM + response_model + json: {before * 1000:8.1f} ms")
+    print(f"columns + orjson:            {after * 1000:8.1f} ms")
+    print(f"speedup:                     {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
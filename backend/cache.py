@@ -0,0 +1,249 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+import orjson
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = int(os.getenv("UPSTREAM_CACHE_ENTRIES", "2000"))
+# Shared by every worker on the host; empty disables the L2 tier
+CACHE_L2_PATH = os.getenv("CACHE_L2_PATH", os.path.join(tempfile.gettempdir(), "mediamingle-cache.sqlite3"))
+CACHE_L2_MAX_ENTRIES = int(os.getenv("CACHE_L2_MAX_ENTRIES", "20000"))
+# How long one worker may hold the right to fetch a key before others stop waiting
+FETCH_LEASE_SECONDS = float(os.getenv("CACHE_FETCH_LEASE", "15"))
+FETCH_POLL_INTERVAL = 0.05
+PURGE_EVERY = 200  # L2 writes between expiry sweeps
+
+
+def encode(value):
+    """Compact binary form of a JSON payload"""
+    return zlib.compress(orjson.dumps(value), 3)
+
+
+def decode(data):
+    return orjson.loads(zlib.decompress(data))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a per-entry TTL"""
+
+    def __init__(self, name, max_entries=MAX_ENTRIES):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, record=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if record:
+            metrics.record_cache(self.name, entry is not None)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def ttl_remaining(self, key):
+        """Seconds until key expires, or 0 if it is missing"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return max(0.0, entry[1] - time.monotonic()) if entry is not None else 0.0
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteCache:
+    """TTL cache in a local SQLite file, shared by all worker processes.
+
+    Values are stored as zlib-compressed orjson. Expiry uses wall-clock
+    time since monotonic clocks are per process. The same file holds fetch
+    leases so that only one worker at a time loads a given key.
+    """
+
+    def __init__(self, name, path=CACHE_L2_PATH, max_entries=CACHE_L2_MAX_ENTRIES):
+        self.name = name
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self):
+        """This thread's connection, opened (and the file set up) on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS ix_entries_expires_at ON entries (expires_at);"
+                "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL);"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _entry(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row
+
+    def get(self, key, record=True):
+        """(value, seconds left) for key, or None"""
+        try:
+            row = self._entry(key)
+            result = (decode(row[0]), row[1] - time.time()) if row is not None else None
+        except (sqlite3.Error, zlib.error, orjson.JSONDecodeError):
+            logger.exception("L2 cache read failed for %s", key)
+            result = None
+        if record:
+            metrics.record_cache(self.name, result is not None)
+        return result
+
+    def contains(self, key):
+        try:
+            return self._entry(key) is not None
+        except sqlite3.Error:
+            return False
+
+    def set(self, key, value, ttl):
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, encode(value), time.time() + ttl)
+            )
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                self._purge(conn)
+        except sqlite3.Error:
+            logger.exception("L2 cache write failed for %s", key)
+
+    def _purge(self, conn):
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM entries WHERE key IN "
+            "(SELECT key FROM entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        conn.execute("DELETE FROM leases WHERE expires_at <= ?", (time.time(),))
+
+    def acquire(self, key, lease=FETCH_LEASE_SECONDS):
+        """Try to take the fetch lease for key; True if this worker got it"""
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)", (key, now + lease))
+            return cursor.rowcount == 1
+        except sqlite3.Error:
+            # Without the shared file, fall back to fetching independently
+            return True
+
+    def release(self, key):
+        try:
+            self._conn().execute("DELETE FROM leases WHERE key = ?", (key,))
+        except sqlite3.Error:
+            logger.exception("Failed to release fetch lease for %s", key)
+
+
+class TieredCache:
+    """In-process L1 in front of an optional shared L2.
+
+    L1 holds parsed payloads, so its values are shared between requests and
+    must never be mutated. An L2 hit is copied into L1 for the rest of its
+    TTL. single_flight() makes concurrent misses for one key, in this
+    process and (through L2 leases) in sibling workers, wait for a single
+    upstream fetch.
+    """
+
+    def __init__(self, l1, l2=None):
+        self.l1 = l1
+        self.l2 = l2
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def get(self, key, record=True, l1=True):
+        """l1=False reads L2 only, for values the caller keeps in memory in another form"""
+        if l1:
+            value = self.l1.get(key, record)
+            if value is not None:
+                return value
+        if self.l2 is None:
+            return None
+        entry = self.l2.get(key, record)
+        if entry is None:
+            return None
+        value, ttl = entry
+        if l1:
+            self.l1.set(key, value, ttl)
+        return value
+
+    def set(self, key, value, ttl, l1=True):
+        if l1:
+            self.l1.set(key, value, ttl)
+        if self.l2 is not None:
+            self.l2.set(key, value, ttl)
+
+    def ttl_remaining(self, key):
+        remaining = self.l1.ttl_remaining(key)
+        if remaining or self.l2 is None:
+            return remaining
+        entry = self.l2.get(key, record=False)
+        return max(0.0, entry[1]) if entry is not None else 0.0
+
+    def _wait_for_lease(self, key):
+        """True once this worker holds key's lease; False if another filled it"""
+        deadline = time.monotonic() + FETCH_LEASE_SECONDS
+        while not self.l2.acquire(key):
+            if self.l2.contains(key) or time.monotonic() > deadline:
+                return False
+            time.sleep(FETCH_POLL_INTERVAL)
+        return True
+
+    @contextmanager
+    def single_flight(self, key):
+        """Hold while loading key; re-check the cache once inside"""
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            leased = self.l2 is not None and self._wait_for_lease(key)
+            try:
+                yield
+            finally:
+                if leased:
+                    self.l2.release(key)
+                with self._locks_guard:
+                    self._locks.pop(key, None)
+
+
+def _make_upstream_cache():
+    # The L2 file is opened lazily; if it turns out to be unusable every
+    # operation degrades to a miss and L1 keeps working
+    l2 = SQLiteCache("upstream_l2") if CACHE_L2_PATH else None
+    return TieredCache(TTLCache("upstream"), l2)
+
+
+# Parsed upstream JSON keyed by request; values are shared, never mutate them
+upstream_cache = _make_upstream_cache()
@@ -0,0 +1,108 @@
+import os
+
+from cache import TTLCache, upstream_cache
+from catalog_entry import from_payload
+from snapshot import serve_with_snapshot
+from upstream import tmdb_get, jikan_get
+
+# Seconds each kind of upstream payload stays in upstream_cache
+TRENDING_TTL = 600
+GENRES_TTL = 86400
+DETAIL_TTL = 3600
+RECOMMEND_TTL = 1800
+SEARCH_TTL = 300
+DISCOVER_TTL = 600
+
+TRENDING_SOURCES = {
+    "movies": lambda: tmdb_get("/trending/movie/week"),
+    "tv": lambda: tmdb_get("/trending/tv/week"),
+    "anime": lambda: jikan_get("/top/anime", {"limit": 20}),
+}
+
+DETAIL_PARAMS = {"append_to_response": "credits,videos,similar"}
+# Detail payloads are kept in memory as compact CatalogEntry objects; the raw
+# JSON only goes to the shared L2
+DETAIL_ENTRIES = int(os.getenv("CATALOG_DETAIL_ENTRIES", "20000"))
+detail_entries = TTLCache("catalog_details", max_entries=DETAIL_ENTRIES)
+
+DETAIL_SOURCES = {
+    "movies": ("movie", lambda content_id: tmdb_get(f"/movie/{content_id}", DETAIL_PARAMS)),
+    "tv": ("tv", lambda content_id: tmdb_get(f"/tv/{content_id}", DETAIL_PARAMS)),
+    "anime": ("anime", lambda content_id: jikan_get(f"/anime/{content_id}/full")),
+}
+
+
+def load(key, ttl, fetch, detail=False, snapshot=True, refresh=False, l1=True):
+    """Upstream JSON for key from the cache, else from upstream.
+
+    Concurrent misses for a key, across threads and workers, share one
+    upstream fetch. Snapshot-backed keys fall back to the last good payload
+    when upstream fails; refresh=True skips the cache lookup to re-fetch
+    before expiry. l1=False keeps the payload out of the in-process cache.
+    """
+    if not refresh:
+        payload = upstream_cache.get(key, l1=l1)
+        if payload is not None:
+            return payload
+
+    with upstream_cache.single_flight(key):
+        if not refresh:
+            # Filled by whoever held the fetch while we waited
+            payload = upstream_cache.get(key, record=False, l1=l1)
+            if payload is not None:
+                return payload
+        return _fetch(key, ttl, fetch, detail, snapshot, l1)
+
+
+def _fetch(key, ttl, fetch, detail, snapshot, l1=True):
+    def remember(payload):
+        upstream_cache.set(key, payload, ttl, l1=l1)
+
+    if snapshot:
+        return serve_with_snapshot(key, fetch, detail, on_fresh=remember)
+
+    response = fetch()
+    payload = response.json()
+    if response.status_code == 200:
+        remember(payload)
+    return payload
+
+
+def trending(content_type, refresh=False):
+    return load(f"trending-{content_type}", TRENDING_TTL, TRENDING_SOURCES[content_type], refresh=refresh)
+
+
+def genres(kind, refresh=False):
+    """kind is TMDB's 'movie' or 'tv'"""
+    return load(f"{kind}-genres", GENRES_TTL, lambda: tmdb_get(f"/genre/{kind}/list"), refresh=refresh)
+
+
+def details(content_type, content_id, refresh=False):
+    """Detail JSON, served from a compact in-memory entry when there is one.
+
+    Returns a fresh dict each call. Error and stale snapshot answers are
+    passed through as-is and not kept.
+    """
+    prefix, fetch = DETAIL_SOURCES[content_type]
+    key = f"{prefix}:{content_id}"
+    if not refresh:
+        entry = detail_entries.get(key)
+        if entry is not None:
+            return entry.to_payload()
+
+    # Keyed apart from the raw payload, whose own single flight runs inside load()
+    with upstream_cache.single_flight(f"entry:{key}"):
+        if not refresh:
+            entry = detail_entries.get(key, record=False)
+            if entry is not None:
+                return entry.to_payload()
+        payload = load(key, DETAIL_TTL, lambda: fetch(content_id), detail=True, refresh=refresh, l1=False)
+        entry = from_payload(content_type, payload)
+        if entry is None:
+            return payload
+        detail_entries.set(key, entry, upstream_cache.ttl_remaining(key) or DETAIL_TTL)
+        return entry.to_payload()
+
+
+def params_key(params):
+    return "&".join(f"{k}={v}" for k, v in sorted(params.items()) if k != "api_key")
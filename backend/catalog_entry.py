@@ -0,0 +1,226 @@
+import sys
+
+MAX_CAST = 12
+MAX_SIMILAR = 20
+
+_intern = sys.intern
+
+
+def _intern_or_none(value):
+    return _intern(value) if isinstance(value, str) else None
+
+
+def _tmdb_fields(content_type):
+    """Names of the title and date fields, which differ between movies and tv"""
+    return ("title", "release_date") if content_type == "movies" else ("name", "first_air_date")
+
+
+class CastMember:
+    __slots__ = ("id", "name", "character", "profile_path")
+
+    def __init__(self, id, name, character, profile_path):
+        self.id = id
+        self.name = name
+        self.character = character
+        self.profile_path = profile_path
+
+    def to_payload(self):
+        return {"id": self.id, "name": self.name, "character": self.character, "profile_path": self.profile_path}
+
+
+class Card:
+    """A similar/recommended title, as much as a poster card needs"""
+    __slots__ = ("id", "title", "image", "score", "date")
+
+    def __init__(self, id, title, image, score, date):
+        self.id = id
+        self.title = title
+        self.image = image
+        self.score = score
+        self.date = date
+
+
+class CatalogEntry:
+    """Compact in-memory form of a TMDB/Jikan detail payload.
+
+    A raw detail payload carries the full cast and crew, every video and the
+    similar titles with their overviews, most of which the detail page never
+    shows. An entry keeps only what it renders, with genre names, languages
+    and statuses interned; to_payload() rebuilds the subset of the upstream
+    JSON shape the frontend reads.
+    """
+    __slots__ = (
+        "content_type", "id", "title", "original_title", "overview", "image", "backdrop",
+        "date", "year", "score", "score_count", "runtime", "status", "language",
+        "genres", "cast", "trailer", "similar", "extra",
+    )
+
+    def __init__(self, content_type, id, title, original_title=None, overview=None, image=None,
+                 backdrop=None, date=None, year=None, score=None, score_count=None, runtime=None,
+                 status=None, language=None, genres=(), cast=(), trailer=None, similar=(), extra=None):
+        self.content_type = content_type
+        self.id = id
+        self.title = title
+        self.original_title = original_title
+        self.overview = overview
+        self.image = image  # TMDB poster path, or Jikan (image_url, large_image_url)
+        self.backdrop = backdrop
+        self.date = date
+        self.year = year
+        self.score = score
+        self.score_count = score_count
+        self.runtime = runtime
+        self.status = status
+        self.language = language
+        self.genres = genres  # ((id, interned name), ...)
+        self.cast = cast
+        self.trailer = trailer  # TMDB video key / YouTube id
+        self.similar = similar
+        self.extra = extra  # small type-specific scalars, e.g. number_of_seasons
+
+    def to_payload(self):
+        if self.content_type == "anime":
+            return self._jikan_payload()
+        return self._tmdb_payload()
+
+    def _tmdb_payload(self):
+        title_field, date_field = _tmdb_fields(self.content_type)
+        payload = {
+            "id": self.id,
+            title_field: self.title,
+            "original_" + title_field: self.original_title,
+            "overview": self.overview,
+            "poster_path": self.image,
+            "backdrop_path": self.backdrop,
+            date_field: self.date,
+            "vote_average": self.score,
+            "vote_count": self.score_count,
+            "runtime": self.runtime,
+            "status": self.status,
+            "original_language": self.language,
+            "genres": [{"id": genre_id, "name": name} for genre_id, name in self.genres],
+            "credits": {"cast": [member.to_payload() for member in self.cast]},
+            "videos": {"results": [
+                {"key": self.trailer, "site": "YouTube", "type": "Trailer"}
+            ] if self.trailer else []},
+            "similar": {"results": [
+                {"id": card.id, title_field: card.title, "poster_path": card.image,
+                 "vote_average": card.score, date_field: card.date}
+                for card in self.similar
+            ]},
+        }
+        if self.extra:
+            payload.update(self.extra)
+        return payload
+
+    def _jikan_payload(self):
+        image_url, large_image_url = self.image or (None, None)
+        data = {
+            "mal_id": self.id,
+            "title": self.title,
+            "title_english": self.original_title,
+            "synopsis": self.overview,
+            "images": {"jpg": {"image_url": image_url, "large_image_url": large_image_url}},
+            "trailer": {"youtube_id": self.trailer},
+            "aired": {"from": self.date},
+            "year": self.year,
+            "score": self.score,
+            "scored_by": self.score_count,
+            "duration": self.runtime,
+            "status": self.status,
+            "genres": [{"mal_id": genre_id, "name": name} for genre_id, name in self.genres],
+        }
+        if self.extra:
+            data.update(self.extra)
+        return {"data": data}
+
+
+# ====================== CONVERTERS ======================
+
+def _genres(items, id_field):
+    return tuple((genre.get(id_field), _intern_or_none(genre.get("name"))) for genre in items or ())
+
+
+def from_tmdb(content_type, payload):
+    """CatalogEntry from a TMDB movie/tv detail with credits,videos,similar appended"""
+    title_field, date_field = _tmdb_fields(content_type)
+    cast = tuple(
+        CastMember(member.get("id"), member.get("name"), member.get("character"), member.get("profile_path"))
+        for member in ((payload.get("credits") or {}).get("cast") or ())[:MAX_CAST]
+    )
+    trailer = next((
+        video.get("key") for video in (payload.get("videos") or {}).get("results") or ()
+        if video.get("type") == "Trailer" and video.get("site") == "YouTube"
+    ), None)
+    similar = tuple(
+        Card(item.get("id"), item.get(title_field), item.get("poster_path"),
+             item.get("vote_average"), item.get(date_field))
+        for item in ((payload.get("similar") or {}).get("results") or ())[:MAX_SIMILAR]
+    )
+    runtime = payload.get("runtime")
+    if runtime is None and payload.get("episode_run_time"):
+        runtime = payload["episode_run_time"][0]
+    extra = None
+    if content_type == "tv":
+        extra = {
+            key: payload[key] for key in ("number_of_seasons", "number_of_episodes")
+            if payload.get(key) is not None
+        } or None
+    return CatalogEntry(
+        content_type,
+        payload.get("id"),
+        payload.get(title_field),
+        original_title=payload.get("original_" + title_field),
+        overview=payload.get("overview"),
+        image=payload.get("poster_path"),
+        backdrop=payload.get("backdrop_path"),
+        date=payload.get(date_field),
+        score=payload.get("vote_average"),
+        score_count=payload.get("vote_count"),
+        runtime=runtime,
+        status=_intern_or_none(payload.get("status")),
+        language=_intern_or_none(payload.get("original_language")),
+        genres=_genres(payload.get("genres"), "id"),
+        cast=cast,
+        trailer=trailer,
+        similar=similar,
+        extra=extra,
+    )
+
+
+def from_jikan(payload):
+    """CatalogEntry from a Jikan /anime/{id}/full response"""
+    data = payload.get("data") or {}
+    jpg = (data.get("images") or {}).get("jpg") or {}
+    image = (jpg.get("image_url"), jpg.get("large_image_url"))
+    extra = {
+        key: _intern_or_none(data[key]) if key in ("type", "rating") else data[key]
+        for key in ("episodes", "type", "rating")
+        if data.get(key) is not None
+    } or None
+    return CatalogEntry(
+        "anime",
+        data.get("mal_id"),
+        data.get("title"),
+        original_title=data.get("title_english"),
+        overview=data.get("synopsis"),
+        image=image if any(image) else None,
+        date=(data.get("aired") or {}).get("from"),
+        year=data.get("year"),
+        score=data.get("score"),
+        score_count=data.get("scored_by"),
+        runtime=data.get("duration"),
+        status=_intern_or_none(data.get("status")),
+        genres=_genres(data.get("genres"), "mal_id"),
+        trailer=(data.get("trailer") or {}).get("youtube_id"),
+        extra=extra,
+    )
+
+
+def from_payload(content_type, payload):
+    """CatalogEntry for a good detail payload; None for errors and stale snapshot answers"""
+    if not isinstance(payload, dict) or payload.get("stale"):
+        return None
+    if content_type == "anime":
+        return from_jikan(payload) if (payload.get("data") or {}).get("mal_id") is not None else None
+    return from_tmdb(content_type, payload) if payload.get("id") is not None else None
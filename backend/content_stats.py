@@ -0,0 +1,112 @@
+from sqlalchemy import and_, case, delete, func, insert, select, text, tuple_, update
+from sqlalchemy.exc import IntegrityError
+import math
+
+from database import ContentStats, Rating
+
+BUCKETS = range(1, 11)
+BUCKET_COLUMNS = tuple(f"b{i}" for i in BUCKETS)
+
+
+def bucket_of(rating):
+    """Histogram bucket (1-10) for a 1-10 rating"""
+    return min(10, max(1, math.floor(rating)))
+
+
+def apply_rating_change(db, content_type, content_id, old=None, new=None):
+    """Fold one rating insert (old=None), update or delete (new=None) into content_stats.
+
+    Runs inside the caller's transaction, so the aggregate commits or rolls
+    back together with the rating itself.
+    """
+    if old == new:
+        return
+    count_delta = (new is not None) - (old is not None)
+    values = {
+        "rating_count": ContentStats.rating_count + count_delta,
+        "rating_sum": ContentStats.rating_sum + (new or 0.0) - (old or 0.0),
+    }
+    deltas = {}
+    if old is not None:
+        deltas[bucket_of(old)] = deltas.get(bucket_of(old), 0) - 1
+    if new is not None:
+        deltas[bucket_of(new)] = deltas.get(bucket_of(new), 0) + 1
+    for bucket, delta in deltas.items():
+        if delta:
+            column = getattr(ContentStats, f"b{bucket}")
+            values[f"b{bucket}"] = column + delta
+
+    updated = db.execute(update(ContentStats).where(
+        ContentStats.content_type == content_type, ContentStats.content_id == content_id
+    ).values(**values)).rowcount
+    if updated or new is None:
+        return
+    try:
+        with db.begin_nested():
+            buckets = {column: 0 for column in BUCKET_COLUMNS}
+            buckets[f"b{bucket_of(new)}"] = 1
+            db.add(ContentStats(
+                content_type=content_type, content_id=content_id, rating_count=1, rating_sum=new, **buckets
+            ))
+    except IntegrityError:
+        # Another rating created the row first
+        apply_rating_change(db, content_type, content_id, old, new)
+
+
+def stats_to_dict(row):
+    if row is None or not row.rating_count:
+        return {"count": 0, "average": None, "histogram": [0] * len(BUCKETS)}
+    return {
+        "count": row.rating_count,
+        "average": round(row.rating_sum / row.rating_count, 2),
+        "histogram": [getattr(row, column) for column in BUCKET_COLUMNS],
+    }
+
+
+def stats_for(db, content_type, content_id):
+    row = db.query(ContentStats).filter(
+        ContentStats.content_type == content_type, ContentStats.content_id == content_id
+    ).first()
+    return stats_to_dict(row)
+
+
+def stats_for_many(db, items):
+    """{(content_type, content_id): stats dict} for every item, one query"""
+    rows = db.query(ContentStats).filter(
+        tuple_(ContentStats.content_type, ContentStats.content_id).in_(items)
+    ).all() if items else []
+    found = {(row.content_type, row.content_id): row for row in rows}
+    return {item: stats_to_dict(found.get(item)) for item in items}
+
+
+def recompute(db):
+    """Rebuild content_stats from the ratings table in one statement.
+
+    On Postgres, rating writes are blocked for the duration so no change
+    slips between the delete and the rebuild. Returns the number of titles.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE ratings IN SHARE MODE"))
+
+    def in_bucket(bucket):
+        if bucket == 1:
+            return Rating.rating < 2
+        if bucket == 10:
+            return Rating.rating >= 10
+        return and_(Rating.rating >= bucket, Rating.rating < bucket + 1)
+
+    aggregates = select(
+        Rating.content_type,
+        Rating.content_id,
+        func.count(Rating.id),
+        func.sum(Rating.rating),
+        *[func.sum(case((in_bucket(bucket), 1), else_=0)) for bucket in BUCKETS]
+    ).where(Rating.rating.is_not(None)).group_by(Rating.content_type, Rating.content_id)
+
+    db.execute(delete(ContentStats))
+    db.execute(insert(ContentStats).from_select(
+        ["content_type", "content_id", "rating_count", "rating_sum", *BUCKET_COLUMNS], aggregates
+    ))
+    count = db.query(func.count()).select_from(ContentStats).scalar()
+    db.commit()
+    return count
@@ -1,8 +1,22 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Boolean, Float, Text
+from sqlalchemy import create_engine, event, text, Column, Integer, String, DateTime, ForeignKey, Boolean, Float, Text, Index
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import Session, sessionmaker, relationship
+from contextlib import contextmanager
 from datetime import datetime
+from fastapi import Request
+from jose import JWTError, jwt
+import logging
 import os
+import random
+import threading
+import time
+
+from cache import CACHE_L2_PATH, SQLiteCache, TTLCache, TieredCache
+import metrics
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -10,10 +24,284 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Optional comma-separated read replicas; GET handlers that can tolerate a
+# little lag read from them through get_read_db
+DATABASE_REPLICA_URLS = [
+    url.replace("postgres://", "postgresql://", 1) if url.startswith("postgres://") else url
+    for url in (u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",")) if url
+]
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))  # seconds behind the primary
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+# After a user writes, their reads stay on the primary this long
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+# Set DB_AUTO_CREATE=1 to create missing tables at startup (local development);
+# deployments run `python manage.py init-db` instead.
+DB_AUTO_CREATE = os.getenv("DB_AUTO_CREATE", "") == "1"
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker that creates the engine on first use instead of at import"""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and "bind" not in local_kw:
+            get_engine()
+        return super().__call__(**local_kw)
+
+
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+
+def get_engine():
+    """The process-wide Engine, created on first call"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(DATABASE_URL)
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+# ====================== READ REPLICAS ======================
+
+# 0 when the replica has replayed everything it received, since the replay
+# timestamp stops moving while the primary is idle
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReplicaSession(Session):
+    """Session on a read replica that moves to the primary when the replica fails.
+
+    A statement that fails with an operational error (replica down, query
+    cancelled by replay) marks the replica unhealthy and runs once more on
+    the primary, so the request still gets its answer. The rest of the
+    session stays on the primary.
+    """
+
+    def execute(self, *args, **kwargs):
+        try:
+            return super().execute(*args, **kwargs)
+        except OperationalError:
+            replica = self.info.pop("replica", None)
+            if replica is None:
+                raise
+            logger.warning("Read on replica %s failed; retrying on the primary", replica.name, exc_info=True)
+            replica.mark_unhealthy()
+            metrics.DB_READS.inc("primary", "replica_error")
+            self.rollback()
+            self.bind = get_engine()
+            return super().execute(*args, **kwargs)
+
+
+class Replica:
+    """One read replica with its last observed health and lag"""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.engine = None
+        self.sessionmaker = sessionmaker(class_=ReplicaSession, autocommit=False, autoflush=False)
+        self.healthy = True
+        self.lag = 0.0
+        self.checked_at = float("-inf")
+        self._check_lock = threading.Lock()
+
+    def get_engine(self):
+        if self.engine is None:
+            with self._check_lock:
+                if self.engine is None:
+                    connect_args = {"connect_timeout": 2} if self.url.startswith("postgresql") else {}
+                    self.engine = create_engine(self.url, pool_pre_ping=True, connect_args=connect_args)
+                    self.sessionmaker.configure(bind=self.engine)
+        return self.engine
+
+    def usable(self):
+        """Healthy and within REPLICA_MAX_LAG, re-checking at most every REPLICA_CHECK_INTERVAL"""
+        if time.monotonic() - self.checked_at >= REPLICA_CHECK_INTERVAL:
+            self.check()
+        return self.healthy and self.lag <= REPLICA_MAX_LAG
+
+    def check(self):
+        engine = self.get_engine()
+        # One thread re-checks; the rest use the previous result meanwhile
+        if not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == "postgresql":
+                    self.lag = float(conn.execute(REPLICA_LAG_SQL).scalar() or 0.0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    self.lag = 0.0
+            self.healthy = True
+        except Exception:
+            if self.healthy:
+                logger.warning("Read replica %s is unreachable; reading from the primary", self.name, exc_info=True)
+            self.healthy = False
+        finally:
+            self.checked_at = time.monotonic()
+            self._check_lock.release()
+        metrics.DB_REPLICA_LAG.set(self.lag if self.healthy else -1, self.name)
+
+    def mark_unhealthy(self):
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+
+replicas = [Replica(f"replica{i}", url) for i, url in enumerate(DATABASE_REPLICA_URLS)]
+
+# Subjects that wrote recently. Shared through the L2 file so a read landing
+# on a sibling worker also goes to the primary.
+recent_writers = TieredCache(
+    TTLCache("recent_writers"),
+    SQLiteCache("recent_writers_l2") if CACHE_L2_PATH else None
+)
+
+
+def _token_subject(request):
+    """JWT subject of the request, unverified: it only picks which database to read"""
+    authorization = request.headers.get("authorization", "") if request is not None else ""
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        return jwt.get_unverified_claims(authorization[7:]).get("sub")
+    except JWTError:
+        return None
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_writer(session):
+    subject = session.info.get("subject")
+    if subject and replicas:
+        recent_writers.set(f"wrote:{subject}", 1, READ_YOUR_WRITES_SECONDS)
+
+
+@event.listens_for(Session, "before_flush")
+def _refuse_read_only_flush(session, flush_context, instances):
+    if session.info.get("read_only") and (session.new or session.dirty or session.deleted):
+        raise RuntimeError("Attempted to write through a read-only session")
+
+
+def choose_replica(subject=None):
+    """A usable replica for this reader, or None to read from the primary"""
+    if not replicas:
+        return None
+    if subject and recent_writers.get(f"wrote:{subject}", record=False):
+        metrics.DB_READS.inc("primary", "recent_write")
+        return None
+    candidates = [replica for replica in replicas if replica.usable()]
+    if not candidates:
+        metrics.DB_READS.inc("primary", "no_replica")
+        return None
+    replica = random.choice(candidates)
+    metrics.DB_READS.inc(replica.name, "ok")
+    return replica
+
+# ====================== QUERY INSTRUMENTATION ======================
+
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Same statement this many times in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+# Max statements per request; 0 disables. Per-route overrides go in QUERY_BUDGETS.
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "0"))
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "") == "1"
+QUERY_BUDGETS = {}
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more statements than its budget allows"""
+
+
+def _statement_summary(statement):
+    return " ".join(statement.split())[:500]
+
+
+def _parameter_shape(parameters, executemany):
+    """Describe bound parameters by type only, never by value"""
+    if executemany:
+        rows = list(parameters or [])
+        first = _parameter_shape(rows[0], False) if rows else "()"
+        return f"{len(rows)} x {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return type(parameters).__name__
+
+
+def _route_of(stats):
+    route = stats.scope.get("route") if stats.scope else None
+    return getattr(route, "path", "unknown")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    metrics.record_query(elapsed)
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms): %s params=%s",
+            elapsed * 1000, _statement_summary(statement), _parameter_shape(parameters, executemany)
+        )
+
+    stats = metrics.current_request.get()
+    if stats is None:
+        return
+
+    repeats = stats.statements.get(statement, 0) + 1
+    stats.statements[statement] = repeats
+    if repeats == N_PLUS_ONE_THRESHOLD:
+        logger.warning(
+            "Possible N+1 in %s: statement ran %d times: %s",
+            _route_of(stats), repeats, _statement_summary(statement)
+        )
+
+    budget = QUERY_BUDGETS.get(_route_of(stats), QUERY_BUDGET)
+    if budget and stats.query_count == budget + 1:
+        message = f"{_route_of(stats)} exceeded its query budget of {budget}"
+        if QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    timings = context.connection.info.get("query_start_time") if context.connection else None
+    if timings:
+        timings.pop()
+
+
+@contextmanager
+def track_queries():
+    """Collect query stats for code running outside a request, e.g. in tests:
+
+        with track_queries() as stats:
+            ...
+        assert stats.query_count <= 3
+    """
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    try:
+        yield stats
+    finally:
+        metrics.current_request.reset(token)
+
+
 # ====================== MODELS ======================
 
 class User(Base):
@@ -63,6 +351,11 @@ class Favorite(Base):
     
     user = relationship("User", back_populates="favorites")
 
+    __table_args__ = (
+        # Duplicate check in POST /favorites, GET /favorites/check/{type}/{id}, /library/status
+        Index("ix_favorites_user_content", "user_id", "content_type", "content_id"),
+    )
+
 
 class History(Base):
     __tablename__ = "history"
@@ -77,6 +370,13 @@ class History(Base):
     
     user = relationship("User", back_populates="history")
 
+    __table_args__ = (
+        # history_buffer's dedup of repeat views, /library/status and library sync presence;
+        # GET /history filters on its user_id prefix
+        Index("ix_history_user_content", "user_id", "content_type", "content_id"),
+        Index("ix_history_viewed_at", "viewed_at"),  # popularity reloads read recent views
+    )
+
 
 class Rating(Base):
     __tablename__ = "ratings"
@@ -93,6 +393,11 @@ class Rating(Base):
     
     user = relationship("User", back_populates="ratings")
 
+    __table_args__ = (
+        # Existing-rating check in POST /ratings, GET /ratings/{type}/{id}, /library/status
+        Index("ix_ratings_user_content", "user_id", "content_type", "content_id"),
+    )
+
 
 # ====================== NEW: SOCIAL FEATURES ======================
 
@@ -109,6 +414,11 @@ class Follow(Base):
     follower_user = relationship("User", foreign_keys=[follower_id], back_populates="following")
     following_user = relationship("User", foreign_keys=[following_id], back_populates="followers")
 
+    __table_args__ = (
+        Index("ix_follows_follower_id", "follower_id"),
+        Index("ix_follows_following_id", "following_id"),
+    )
+
 
 class Activity(Base):
     """User activity feed (ratings, favorites, etc.)"""
@@ -128,15 +438,117 @@ class Activity(Base):
     
     user = relationship("User", back_populates="activities")
 
+    __table_args__ = (
+        # Feed reads and account deletion select by author / followed user
+        Index("ix_activities_user_id", "user_id"),
+        Index("ix_activities_target_user_id", "target_user_id"),
+    )
+
+
+# ====================== CONTENT STATS ======================
+
+class ContentStats(Base):
+    """Community rating aggregates per title, maintained on every rating write"""
+    __tablename__ = "content_stats"
+
+    content_type = Column(String, primary_key=True)
+    content_id = Column(String, primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0.0)
+    # Histogram: b1 counts ratings below 2, bN ratings in [N, N+1), b10 a perfect 10
+    b1 = Column(Integer, nullable=False, default=0)
+    b2 = Column(Integer, nullable=False, default=0)
+    b3 = Column(Integer, nullable=False, default=0)
+    b4 = Column(Integer, nullable=False, default=0)
+    b5 = Column(Integer, nullable=False, default=0)
+    b6 = Column(Integer, nullable=False, default=0)
+    b7 = Column(Integer, nullable=False, default=0)
+    b8 = Column(Integer, nullable=False, default=0)
+    b9 = Column(Integer, nullable=False, default=0)
+    b10 = Column(Integer, nullable=False, default=0)
+
+
+# ====================== LIBRARY SYNC ======================
+
+class LibraryVersion(Base):
+    """Per-user counter bumped by every favorites/ratings/history write"""
+    __tablename__ = "library_versions"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    pruned_through = Column(Integer, nullable=False, default=0)  # changes at or below this are gone
+
+
+class LibraryChange(Base):
+    """One library change, logged under the version that introduced it"""
+    __tablename__ = "library_changes"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)  # 'favorite', 'rating', 'history'
+    op = Column(String, nullable=False)  # 'upsert', 'delete', 'clear'
+    content_type = Column(String, nullable=True)
+    content_id = Column(String, nullable=True)
+    ref_id = Column(Integer, nullable=True)  # favorite/rating row id
+    value = Column(Float, nullable=True)  # rating score
+
+    __table_args__ = (
+        Index("ix_library_changes_user_version", "user_id", "version"),
+    )
+
+
+# ====================== ACCOUNT DELETION ======================
+
+class AccountDeletion(Base):
+    """Background deletion of one account's rows, with its progress"""
+    __tablename__ = "account_deletions"
+
+    id = Column(String, primary_key=True)  # unguessable; the handle for polling progress
+    user_id = Column(Integer, nullable=False, index=True)  # no FK: outlives the user row
+    status = Column(String, nullable=False, default="pending")  # 'pending', 'running', 'done'
+    phase = Column(String, nullable=True)  # table being emptied
+    total_rows = Column(Integer, nullable=False, default=0)  # estimate taken when requested
+    deleted_rows = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)  # last failure; the job is retried
+    requested_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
 
 # ====================== DATABASE FUNCTIONS ======================
 
-def get_db():
+def get_db(request: Request = None):
     db = SessionLocal()
+    # Commits made for this user keep their reads on the primary for a while
+    db.info["subject"] = _token_subject(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request = None):
+    """Read-only session on a replica when one is usable, else on the primary"""
+    replica = choose_replica(_token_subject(request))
+    if replica is not None:
+        db = replica.sessionmaker()
+        db.info["replica"] = replica
+    else:
+        db = SessionLocal()
+    db.info["read_only"] = True
     try:
         yield db
     finally:
         db.close()
 
 def init_db():
+    """Create missing tables and indexes; run from manage.py rather than at serve time"""
+    engine = get_engine()
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add indexes declared since
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # Dialect-specific, so not declared on the model
+    from review_search import create_search_index
+    create_search_index(engine)
@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+
+from cache import upstream_cache
+import catalog
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 20
+# Upstream pages one request may walk through to reach its page; deeper
+# cold jumps start from an estimate
+MAX_SCAN_PAGES = int(os.getenv("DISCOVER_MAX_SCAN_PAGES", "8"))
+# Upstream pages read to fill one page; a filter this sparse ends the listing
+MAX_FILL_PAGES = int(os.getenv("DISCOVER_MAX_FILL_PAGES", "25"))
+PREFETCH_ENABLED = os.getenv("DISCOVER_PREFETCH", "1") == "1"
+MAX_PENDING_PREFETCHES = 32
+
+_prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="discover-prefetch")
+_prefetching = set()
+_prefetch_lock = threading.Lock()
+
+
+class DiscoverSource:
+    """One filtered upstream listing, served as fixed-size pages.
+
+    fetch(upstream_page) returns a requests.Response; items(payload) lists
+    the results of a payload; has_more(payload, upstream_page) says whether
+    a further upstream page exists; keep(item) applies the filters upstream
+    cannot. key identifies the query without its page number; page_size is
+    how many results a full upstream page holds.
+    """
+
+    def __init__(self, key, fetch, items, has_more, keep, page_size=20):
+        self.key = key
+        self.fetch = fetch
+        self.items = items
+        self.has_more = has_more
+        self.keep = keep
+        self.page_size = page_size
+
+    def upstream_page(self, number):
+        return catalog.load(
+            f"{self.key}:upstream:{number}", catalog.DISCOVER_TTL,
+            lambda: self.fetch(number), snapshot=False
+        )
+
+
+def _cursor_key(source, page):
+    return f"{source.key}:cursor:{page}"
+
+
+def _start_cursor(source, page):
+    """(upstream page, offset) where page starts, and pages still to skip"""
+    if page == 1:
+        return (1, 0), 0
+    for known in range(page, max(0, page - MAX_SCAN_PAGES), -1):
+        cursor = upstream_cache.get(_cursor_key(source, known), record=False)
+        if cursor is not None:
+            return tuple(cursor), page - known
+    if page <= MAX_SCAN_PAGES:
+        return (1, 0), page - 1
+    return _estimate(source, page), 0
+
+
+def _estimate(source, page):
+    """Where page would start if the filters kept every upstream result.
+
+    The estimate is cached as page's cursor so repeat requests and the
+    pages after it line up with it.
+    """
+    index = (page - 1) * PAGE_SIZE
+    cursor = (index // source.page_size + 1, index % source.page_size)
+    upstream_cache.set(_cursor_key(source, page), list(cursor), catalog.DISCOVER_TTL)
+    return cursor
+
+
+def _fill(source, cursor):
+    """Collect PAGE_SIZE kept items from cursor, fewer only at the end.
+
+    Returns (items, next cursor or None when exhausted, upstream pages used).
+    """
+    upstream_page, offset = cursor
+    items, seen = [], set()
+    used = 0
+    while True:
+        payload = source.upstream_page(upstream_page)
+        used += 1
+        results = source.items(payload)
+        while offset < len(results) and len(items) < PAGE_SIZE:
+            item = results[offset]
+            offset += 1
+            item_id = item.get("id") or item.get("mal_id")
+            if item_id in seen or not source.keep(item):
+                continue
+            seen.add(item_id)
+            items.append(item)
+        more = source.has_more(payload, upstream_page)
+        if len(items) == PAGE_SIZE:
+            if offset == len(results) and not more:
+                return items, None, used
+            return items, (upstream_page, offset), used
+        if not more:
+            return items, None, used
+        if used >= MAX_FILL_PAGES:
+            logger.info("Stopped filling %s after %d upstream pages", source.key, used)
+            return items, None, used
+        upstream_page, offset = upstream_page + 1, 0
+
+
+def get_page(source, page):
+    """Fixed-size page of filtered results and whether another page follows.
+
+    Every page but the last holds PAGE_SIZE items. The cursor where each
+    page ends is cached alongside the upstream pages, so paging forward
+    reuses them and page boundaries stay put while the upstream pages are
+    cached. A walk that would read more than MAX_SCAN_PAGES upstream pages
+    before reaching page jumps to an estimate of where page starts instead.
+    """
+    cursor, skip = _start_cursor(source, page)
+    budget = MAX_SCAN_PAGES
+    number = page - skip
+    while True:
+        if number < page and budget <= 0:
+            cursor, number = _estimate(source, page), page
+        items, next_cursor, used = _fill(source, cursor)
+        budget -= used
+        if next_cursor is None:
+            return (items if number == page else []), False
+        upstream_cache.set(_cursor_key(source, number + 1), list(next_cursor), catalog.DISCOVER_TTL)
+        if number == page:
+            return items, True
+        cursor, number = next_cursor, number + 1
+
+
+def _prefetch(source, page):
+    try:
+        get_page(source, page)
+    except Exception:
+        logger.warning("Prefetch of %s page %d failed", source.key, page, exc_info=True)
+    finally:
+        with _prefetch_lock:
+            _prefetching.discard((source.key, page))
+
+
+def prefetch(source, page):
+    """Load page into the cache in the background while the current one is viewed"""
+    if not PREFETCH_ENABLED:
+        return
+    job = (source.key, page)
+    with _prefetch_lock:
+        if job in _prefetching or len(_prefetching) >= MAX_PENDING_PREFETCHES:
+            return
+        _prefetching.add(job)
+    _prefetcher.submit(_prefetch, source, page)
+
+
+def serve_page(source, page):
+    items, has_next = get_page(source, page)
+    if has_next:
+        prefetch(source, page + 1)
+    return items, has_next
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import threading
+
+from fastapi.encoders import jsonable_encoder
+
+SUBSCRIBER_QUEUE_SIZE = 100
+KEEPALIVE_SECONDS = 15
+RESUME_LIMIT = 100
+
+# Sentinel pushed to a subscriber whose queue overflowed; the stream closes and
+# the client reconnects with Last-Event-ID to catch up from the database.
+# Clients that missed more than RESUME_LIMIT events get it as a `resync`
+# message instead, and refetch the feed.
+RESYNC = object()
+
+
+class Subscription:
+    """A connected feed client and the set of user ids it follows"""
+
+    def __init__(self, user_id, following_ids, loop):
+        self.user_id = user_id
+        self.following_ids = set(following_ids)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def _deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class FeedHub:
+    """In-process publish/subscribe hub for live activity feeds.
+
+    Handlers publish after committing an Activity; only subscribers that
+    follow the acting user receive it, so nothing is built or sent when no
+    follower is connected.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self, user_id, following_ids):
+        """Register a subscriber; must be called from the event loop"""
+        subscription = Subscription(user_id, following_ids, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, actor_id, build_event):
+        """Push an event to every subscriber following actor_id.
+
+        build_event is only called when at least one follower is connected.
+        Safe to call from worker threads.
+        """
+        with self._lock:
+            audience = [s for s in self._subscriptions if actor_id in s.following_ids]
+        if not audience:
+            return
+        event = build_event()
+        for subscription in audience:
+            subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+
+    def follow(self, follower_id, following_id):
+        """Keep connected subscribers in sync with follow changes"""
+        with self._lock:
+            for subscription in self._subscriptions:
+                if subscription.user_id == follower_id:
+                    subscription.following_ids.add(following_id)
+
+    def unfollow(self, follower_id, following_id):
+        with self._lock:
+            for subscription in self._subscriptions:
+                if subscription.user_id == follower_id:
+                    subscription.following_ids.discard(following_id)
+
+
+def format_sse(event):
+    """Encode an activity dict as a Server-Sent Events message"""
+    data = json.dumps(jsonable_encoder(event))
+    return f"id: {event['id']}\nevent: activity\ndata: {data}\n\n"
+
+
+def format_resync(latest_id):
+    """Tell the client to refetch its feed; the id makes reconnects resume from now"""
+    return f"id: {latest_id}\nevent: resync\ndata: {{}}\n\n"
+
+
+feed_hub = FeedHub()
@@ -0,0 +1,195 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update
+import logging
+import os
+import threading
+
+from database import SessionLocal, History
+from library import change, bump_version, log_changes
+import metrics
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "2.0"))  # seconds
+BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "200"))
+MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "5000"))
+# After failed flushes the flusher waits up to this long between attempts
+MAX_RETRY_INTERVAL = float(os.getenv("HISTORY_MAX_RETRY_INTERVAL", "60"))
+
+# A repeat view within this window bumps the existing row instead of adding one
+DEDUP_WINDOW = timedelta(hours=24)
+
+
+class HistoryBuffer:
+    """Write-behind buffer for watch history.
+
+    Views are coalesced per (user, content) in memory and written in batches
+    by a background thread, either every FLUSH_INTERVAL seconds or as soon as
+    BATCH_SIZE entries are waiting. Requests never write themselves: once
+    MAX_PENDING distinct views are queued (e.g. while the database is down),
+    repeat views still coalesce but new ones are dropped, and failed flushes
+    are retried with exponential backoff.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._failures = 0
+
+    def add(self, user_id, content_type, content_id, title, poster_url):
+        """Queue a view and return the entry as it will be stored"""
+        entry = {
+            "id": None,
+            "user_id": user_id,
+            "content_type": content_type,
+            "content_id": content_id,
+            "title": title,
+            "poster_url": poster_url,
+            "viewed_at": datetime.utcnow()
+        }
+        key = (user_id, content_type, content_id)
+        with self._lock:
+            dropped = key not in self._pending and len(self._pending) >= MAX_PENDING
+            if not dropped:
+                self._pending[key] = entry
+            size = len(self._pending)
+
+        if dropped:
+            metrics.HISTORY_DROPPED.inc()
+        elif size >= BATCH_SIZE and not self._failures:
+            self._wake.set()
+        return entry
+
+    def pending_entries(self, user_id):
+        """Queued views of one user, newest first"""
+        with self._lock:
+            entries = [entry for key, entry in self._pending.items() if key[0] == user_id]
+        return sorted(entries, key=lambda entry: entry["viewed_at"], reverse=True)
+
+    def pending_views(self, user_id, items):
+        """{(content_type, content_id): viewed_at} for queued views among items"""
+        with self._lock:
+            entries = [self._pending.get((user_id, content_type, content_id)) for content_type, content_id in items]
+        return {
+            (entry["content_type"], entry["content_id"]): entry["viewed_at"]
+            for entry in entries if entry is not None
+        }
+
+    def discard_user(self, user_id):
+        """Drop queued views of a user whose history is being cleared"""
+        with self._lock:
+            for key in [k for k in self._pending if k[0] == user_id]:
+                del self._pending[key]
+
+    def flush(self):
+        """Write all queued views; returns the number of entries written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            try:
+                self._write(batch)
+            except Exception:
+                self._failures += 1
+                logger.exception("Failed to flush %d history entries (attempt %d)", len(batch), self._failures)
+                with self._lock:
+                    # Views queued meanwhile are newer; the cap still applies
+                    for key, entry in batch.items():
+                        if len(self._pending) >= MAX_PENDING:
+                            metrics.HISTORY_DROPPED.inc()
+                        else:
+                            self._pending.setdefault(key, entry)
+                return 0
+            self._failures = 0
+            return len(batch)
+
+    def _retry_interval(self):
+        if not self._failures:
+            return FLUSH_INTERVAL
+        return min(MAX_RETRY_INTERVAL, FLUSH_INTERVAL * 2 ** self._failures)
+
+    def _write(self, batch):
+        db = self._session_factory()
+        try:
+            entries = list(batch.values())
+            oldest = min(e["viewed_at"] for e in entries) - DEDUP_WINDOW
+
+            # One query for every row that a queued view could bump
+            candidates = db.query(
+                History.id, History.user_id, History.content_type,
+                History.content_id, History.viewed_at
+            ).filter(
+                History.user_id.in_({e["user_id"] for e in entries}),
+                History.content_id.in_({e["content_id"] for e in entries}),
+                History.viewed_at >= oldest
+            ).all()
+
+            latest = {}
+            for row in candidates:
+                key = (row.user_id, row.content_type, row.content_id)
+                if key in batch and (key not in latest or row.viewed_at > latest[key].viewed_at):
+                    latest[key] = row
+
+            updates, inserts = [], []
+            for key, entry in batch.items():
+                row = latest.get(key)
+                if row is not None and row.viewed_at >= entry["viewed_at"] - DEDUP_WINDOW:
+                    updates.append({"id": row.id, "viewed_at": entry["viewed_at"]})
+                else:
+                    inserts.append({k: v for k, v in entry.items() if k != "id"})
+
+            if updates:
+                db.execute(update(History), updates)
+            if inserts:
+                db.execute(insert(History), inserts)
+
+            # One library version per user for everything in this batch
+            by_user = {}
+            for user_id, content_type, content_id in batch:
+                by_user.setdefault(user_id, []).append(change("history", "upsert", content_type, content_id))
+            rows = []
+            for user_id, changes in by_user.items():
+                version = bump_version(db, user_id)
+                rows.extend(dict(c, user_id=user_id, version=version) for c in changes)
+            log_changes(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if self._failures:
+                # Backing off: only the timeout or stop() ends the wait
+                self._stopped.wait(self._retry_interval())
+            else:
+                self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="history-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still queued"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+history_buffer = HistoryBuffer()
@@ -0,0 +1,154 @@
+from starlette.datastructures import Headers, MutableHeaders
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Cache-Control per route template. Private lists use no-cache so clients
+# always revalidate, and get a 304 when nothing changed.
+CACHE_POLICIES = {
+    "/trending-movies": "public, max-age=300, stale-while-revalidate=600",
+    "/trending-tv": "public, max-age=300, stale-while-revalidate=600",
+    "/trending-anime": "public, max-age=300, stale-while-revalidate=600",
+    "/movie-genres": "public, max-age=86400",
+    "/tv-genres": "public, max-age=86400",
+    "/recommend": "public, max-age=600",
+    "/search-movies": "public, max-age=300",
+    "/search-tv": "public, max-age=300",
+    "/search-anime": "public, max-age=300",
+    "/discover-movies": "public, max-age=300",
+    "/discover-tv": "public, max-age=300",
+    "/discover-anime": "public, max-age=300",
+    "/movie/{movie_id}": "public, max-age=300, stale-while-revalidate=3600",
+    "/tv/{tv_id}": "public, max-age=300, stale-while-revalidate=3600",
+    "/anime/{anime_id}": "public, max-age=300, stale-while-revalidate=3600",
+    "/popular": "public, max-age=30",
+    "/users/{username}": "public, max-age=60",
+    "/users/{username}/ratings": "public, max-age=60",
+    "/users/{username}/taste-match": "private, max-age=60",
+    "/reviews/search": "public, max-age=60",
+    "/favorites": "private, no-cache",
+    "/ratings": "private, no-cache",
+    "/ratings/stats": "private, no-cache",
+    "/history": "private, no-cache",
+    "/followers": "private, no-cache",
+    "/following": "private, no-cache",
+    "/feed": "private, no-cache",
+}
+
+MINIMUM_COMPRESS_SIZE = 1024
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def _choose_encoding(accept_encoding):
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _base_tag(tag):
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    base = _base_tag(etag)
+    return any(_base_tag(tag) == base for tag in if_none_match.split(","))
+
+
+class HttpCacheMiddleware:
+    """Conditional GET and compression for JSON responses.
+
+    Buffers successful JSON GET responses, adds a strong content-hash ETag
+    and Cache-Control for routes in CACHE_POLICIES, answers a matching
+    If-None-Match with 304, and gzip/brotli-compresses larger bodies.
+    Streaming and non-JSON responses pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size=MINIMUM_COMPRESS_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        body_parts = []
+        passthrough = False
+
+        async def buffered_send(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                content_type = Headers(raw=message["headers"]).get("content-type", "")
+                if message["status"] != 200 or not content_type.startswith("application/json"):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+            elif message["type"] == "http.response.body":
+                body_parts.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await self._respond(scope, start_message, b"".join(body_parts), send)
+
+        await self.app(scope, receive, buffered_send)
+
+    async def _respond(self, scope, start_message, body, send):
+        request_headers = Headers(scope=scope)
+        headers = MutableHeaders(raw=list(start_message["headers"]))
+        policy = CACHE_POLICIES.get(getattr(scope.get("route"), "path", None))
+        etag = None
+        headers.add_vary_header("Accept-Encoding")
+
+        if policy:
+            etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+            headers["Cache-Control"] = policy
+            if policy.startswith("private"):
+                headers.add_vary_header("Authorization")
+            if etag_matches(request_headers.get("if-none-match"), etag):
+                del headers["content-length"]
+                del headers["content-type"]
+                headers["ETag"] = etag
+                await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        encoding = None
+        if len(body) >= self.minimum_size:
+            encoding = _choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding:
+            body = _compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            if etag:
+                etag = f'{etag[:-1]}-{encoding}"'
+        if etag:
+            headers["ETag"] = etag
+
+        await send({"type": "http.response.start", "status": start_message["status"], "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,200 @@
+from io import BytesIO
+from urllib.parse import urlparse
+import hashlib
+import os
+import tempfile
+import threading
+
+from PIL import Image
+import requests
+
+from upstream import http_session
+import metrics
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mediamingle-img"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+ALLOWED_HOSTS = set(os.getenv("IMAGE_PROXY_HOSTS", "image.tmdb.org,cdn.myanimelist.net").split(","))
+
+WIDTHS = (92, 185, 342, 500)
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+FETCH_TIMEOUT = 10
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ImageProxyError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def snap_width(width):
+    """Smallest fixed width that is at least the requested one"""
+    for candidate in WIDTHS:
+        if candidate >= width:
+            return candidate
+    return WIDTHS[-1]
+
+
+def validate_source(url):
+    parsed = urlparse(url)
+    if parsed.scheme != "https" or parsed.hostname not in ALLOWED_HOSTS:
+        raise ImageProxyError(400, "Image host not allowed")
+
+
+class ImageCache:
+    """Size-bounded on-disk cache of resized posters.
+
+    Files are keyed by a hash of (source url, width, format). Every hit
+    bumps the file's mtime, and once the cache grows past max_bytes the
+    least recently used files are removed down to 90% of the limit.
+    """
+
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+
+    def _path(self, url, width, fmt):
+        key = hashlib.sha256(f"{url}|{width}|{fmt}".encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], f"{key}.{fmt}")
+
+    def _current_size(self):
+        if self._size is None:
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    total += os.path.getsize(os.path.join(root, name))
+            self._size = total
+        return self._size
+
+    def _evict(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        target = self.max_bytes * 0.9
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._size = total
+
+    def _store(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size = self._current_size() + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _render_all(self, url, fmt):
+        """Fetch the source once and write every fixed width in fmt.
+
+        Returns the rendered bytes by width.
+        """
+        try:
+            response = http_session().get(url, timeout=FETCH_TIMEOUT, stream=True)
+        except requests.RequestException as e:
+            raise ImageProxyError(502, f"Failed to fetch image: {e}")
+        if response.status_code != 200:
+            raise ImageProxyError(502 if response.status_code >= 500 else 404, "Source image unavailable")
+        source = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+        if len(source) > MAX_SOURCE_BYTES:
+            raise ImageProxyError(413, "Source image too large")
+
+        try:
+            original = Image.open(BytesIO(source))
+            original = original.convert("RGB")
+        except OSError:
+            raise ImageProxyError(415, "Unsupported image")
+
+        pil_format = FORMATS[fmt][0]
+        rendered = {}
+        for width in WIDTHS:
+            image = original
+            if original.width > width:
+                height = max(1, round(original.height * width / original.width))
+                image = original.resize((width, height), Image.LANCZOS)
+            out = BytesIO()
+            if pil_format == "WEBP":
+                image.save(out, "WEBP", quality=80, method=4)
+            else:
+                image.save(out, "JPEG", quality=82, optimize=True, progressive=True)
+            rendered[width] = out.getvalue()
+            self._store(self._path(url, width, fmt), rendered[width])
+        return rendered
+
+    def get(self, url, width, fmt):
+        """Thumbnail bytes for url at a fixed width, rendering on a miss"""
+        validate_source(url)
+        path = self._path(url, width, fmt)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            metrics.record_cache("image", True)
+            return data
+        except FileNotFoundError:
+            metrics.record_cache("image", False)
+
+        # One render per source image even when many cards ask at once
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault((url, fmt), threading.Lock())
+        with fetch_lock:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = self._render_all(url, fmt)[width]
+        with self._lock:
+            self._fetch_locks.pop((url, fmt), None)
+        return data
+
+
+image_cache = ImageCache()
+
+
+def content_etag(data):
+    return '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+
+
+def parse_range(range_header, size):
+    """(start, end) inclusive for a single 'bytes=' range, None if absent.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].split(",")[0].strip()
+    start_text, _, end_text = spec.partition("-")
+    if not start_text:
+        length = int(end_text)
+        if length <= 0:
+            raise ValueError("empty suffix range")
+        start, end = max(0, size - length), size - 1
+    else:
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    end = min(end, size - 1)
+    if start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end
@@ -0,0 +1,133 @@
+from sqlalchemy import insert, update, delete
+from sqlalchemy.exc import IntegrityError
+import os
+
+from database import LibraryVersion, LibraryChange, Favorite, Rating, History
+
+# Changes kept per user; a client further behind gets a reset and re-downloads the snapshot
+CHANGELOG_KEEP = int(os.getenv("LIBRARY_CHANGELOG_KEEP", "1000"))
+PRUNE_EVERY = 100  # versions between changelog trims
+
+
+def change(kind, op, content_type=None, content_id=None, ref_id=None, value=None):
+    return {
+        "kind": kind, "op": op, "content_type": content_type,
+        "content_id": content_id, "ref_id": ref_id, "value": value
+    }
+
+
+def bump_version(db, user_id):
+    """Increment user_id's library version inside the caller's transaction.
+
+    The UPDATE row-locks the counter, so concurrent writers for one user
+    get distinct, increasing versions.
+    """
+    version = db.execute(
+        update(LibraryVersion).where(LibraryVersion.user_id == user_id)
+        .values(version=LibraryVersion.version + 1).returning(LibraryVersion.version)
+    ).scalar()
+    if version is None:
+        try:
+            with db.begin_nested():
+                db.add(LibraryVersion(user_id=user_id, version=1, pruned_through=0))
+            version = 1
+        except IntegrityError:
+            # Another request created the row first
+            return bump_version(db, user_id)
+
+    if version % PRUNE_EVERY == 0 and version > CHANGELOG_KEEP:
+        floor = version - CHANGELOG_KEEP
+        db.execute(delete(LibraryChange).where(
+            LibraryChange.user_id == user_id, LibraryChange.version <= floor
+        ))
+        db.execute(update(LibraryVersion).where(LibraryVersion.user_id == user_id).values(pruned_through=floor))
+    return version
+
+
+def log_changes(db, rows):
+    """Insert change rows that already carry user_id and version"""
+    if rows:
+        db.execute(insert(LibraryChange), rows)
+
+
+def record_changes(db, user_id, *changes):
+    """Bump the user's version and log changes under it; returns the version"""
+    version = bump_version(db, user_id)
+    log_changes(db, [dict(c, user_id=user_id, version=version) for c in changes])
+    return version
+
+
+def history_presence(db, user_id, content_type, content_id):
+    """History change reflecting whether any view of the content is left"""
+    remaining = db.query(History.id).filter(
+        History.user_id == user_id,
+        History.content_type == content_type,
+        History.content_id == content_id
+    ).first()
+    return change("history", "upsert" if remaining else "delete", content_type, content_id)
+
+
+def current_version(db, user_id):
+    """(version, pruned_through) for user_id; (0, 0) before the first write"""
+    row = db.query(LibraryVersion.version, LibraryVersion.pruned_through).filter(
+        LibraryVersion.user_id == user_id
+    ).first()
+    return (row.version, row.pruned_through) if row else (0, 0)
+
+
+def snapshot(db, user_id):
+    """Compact full library: ids and scores only.
+
+    The version is read first, so rows may already include later changes;
+    replaying changes since that version on top is idempotent.
+    """
+    version, _ = current_version(db, user_id)
+    favorites = db.query(Favorite.content_type, Favorite.content_id, Favorite.id).filter(
+        Favorite.user_id == user_id
+    ).all()
+    ratings = db.query(Rating.content_type, Rating.content_id, Rating.rating, Rating.id).filter(
+        Rating.user_id == user_id
+    ).all()
+    history = db.query(History.content_type, History.content_id).filter(
+        History.user_id == user_id
+    ).distinct().all()
+    return {
+        "version": version,
+        "favorites": [list(row) for row in favorites],
+        "ratings": [list(row) for row in ratings],
+        "history": [list(row) for row in history],
+    }
+
+
+def changes_since(db, user_id, since):
+    """Changes after version since, collapsed to the latest per item.
+
+    Each change is [kind, op, content_type, content_id, ref_id, value]. A
+    history 'clear' supersedes earlier history changes. Returns reset=True
+    when since is older than the retained changelog (or ahead of it).
+    """
+    version, pruned_through = current_version(db, user_id)
+    if since < pruned_through or since > version:
+        return {"version": version, "reset": True, "changes": []}
+
+    rows = db.query(
+        LibraryChange.version, LibraryChange.kind, LibraryChange.op, LibraryChange.content_type,
+        LibraryChange.content_id, LibraryChange.ref_id, LibraryChange.value
+    ).filter(
+        LibraryChange.user_id == user_id,
+        LibraryChange.version > since
+    ).order_by(LibraryChange.version, LibraryChange.id).all()
+
+    latest = {}
+    for row_version, *entry in rows:
+        # Changes committed after the version was read are included; report their version
+        version = max(version, row_version)
+        kind, op, content_type, content_id = entry[:4]
+        if op == "clear":
+            for key in [k for k in latest if k[0] == kind]:
+                del latest[key]
+        key = (kind, content_type, content_id)
+        latest.pop(key, None)  # re-insert so output stays in change order
+        latest[key] = entry
+
+    return {"version": version, "reset": False, "changes": list(latest.values())}
@@ -1,23 +1,109 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+import time
+
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response, JSONResponse, ORJSONResponse
+from sqlalchemy import func, tuple_
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import List, Optional
+import anyio.to_thread
+import asyncio
+import logging
+import math
+
 import requests
-import os
-import time
 
-from database import get_db, init_db, User, Favorite, History, Rating, Follow, Activity
+from content_stats import apply_rating_change, stats_for, stats_for_many
+from database import get_db, get_read_db, init_db, DB_AUTO_CREATE, SessionLocal, AccountDeletion, User, Favorite, History, Rating, Follow, Activity
+from discover import DiscoverSource, serve_page
 from schemas import (
     UserCreate, UserLogin, UserResponse, Token, 
     FavoriteCreate, FavoriteResponse, 
     HistoryCreate, HistoryResponse,
     RatingCreate, RatingUpdate, RatingResponse,
+    LibraryStatusRequest, LibraryStatus, ReviewSearchPage,
     UserPublicProfile, UserUpdateProfile, FollowResponse, FollowerDetail, ActivityResponse
 )
+from account_deletion import request_deletion, progress as deletion_progress
 from auth import get_password_hash, verify_password, create_access_token, get_current_user
+from feed_hub import feed_hub, format_sse, format_resync, RESYNC, KEEPALIVE_SECONDS, RESUME_LIMIT
+from history_buffer import history_buffer
+from http_cache import HttpCacheMiddleware, etag_matches
+from image_cache import (
+    image_cache, snap_width, content_etag, parse_range, ImageProxyError,
+    FORMATS as IMAGE_FORMATS, CACHE_CONTROL as IMAGE_CACHE_CONTROL
+)
+from library import change, record_changes, history_presence
+from metrics import MetricsMiddleware
+from popularity import popularity, HALF_LIVES as POPULARITY_WINDOWS
+from profiling import ProfilingMiddleware, PROFILING_ENABLED
+from rate_limit import RateLimitMiddleware, RATE_LIMIT_ENABLED
+from scheduler import scheduler
+from serialization import response_fields, columns, rows_response
+from snapshot import snapshots
+from upstream import tmdb_get, jikan_get, CircuitOpenError
+import catalog
+import library
+import metrics
+import profiling
+import review_search
+import taste
+
+logger = logging.getLogger(__name__)
+_import_finished = time.perf_counter()
+
+
+def _run_startup_steps(steps):
+    """Run (name, fn) pairs in order; returns {name: seconds}"""
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    timings = {"import": _import_finished - _import_started}
+    steps = [
+        ("snapshots.load", snapshots.load),
+        ("snapshots.start", snapshots.start),
+        ("history_buffer.start", history_buffer.start),
+        ("scheduler.start", scheduler.start),
+        ("popularity.start", popularity.start),
+    ]
+    if DB_AUTO_CREATE:
+        steps.insert(0, ("init_db", init_db))
+    timings.update(await run_in_threadpool(_run_startup_steps, steps))
+    for name, seconds in timings.items():
+        metrics.STARTUP_DURATION.set(seconds, name)
+    logger.info(
+        "Startup finished in %.0f ms (%s)",
+        sum(timings.values()) * 1000,
+        ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items())
+    )
+    yield
+    popularity.stop()
+    scheduler.stop()
+    history_buffer.stop()
+    snapshots.stop()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(HttpCacheMiddleware)
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -28,11 +114,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# API Keys
-TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-
-# Initialize database
-init_db()
+@app.exception_handler(requests.RequestException)
+async def upstream_unavailable(request: Request, exc: requests.RequestException):
+    """Answer 503 when TMDB/Jikan fail after retries and there is no snapshot"""
+    headers = {}
+    if isinstance(exc, CircuitOpenError):
+        headers["Retry-After"] = str(max(1, math.ceil(exc.retry_after)))
+    logger.warning("Upstream request failed: %s", exc)
+    return JSONResponse({"detail": "Upstream service unavailable"}, status_code=503, headers=headers)
 
 # ====================== AUTH ENDPOINTS ======================
 
@@ -82,54 +171,43 @@ def get_me(current_user: User = Depends(get_current_user)):
 
 @app.get("/trending-movies")
 def get_trending_movies():
-    url = "https://api.themoviedb.org/3/trending/movie/week"
-    params = {"api_key": TMDB_API_KEY}
-    response = requests.get(url, params=params)
-    return response.json()
+    return catalog.trending("movies")
 
 
 @app.get("/trending-tv")
 def get_trending_tv():
-    url = "https://api.themoviedb.org/3/trending/tv/week"
-    params = {"api_key": TMDB_API_KEY}
-    response = requests.get(url, params=params)
-    return response.json()
+    return catalog.trending("tv")
 
 
 @app.get("/search-movies")
 def search_movies(query: str):
-    url = "https://api.themoviedb.org/3/search/movie"
-    params = {"api_key": TMDB_API_KEY, "query": query}
-    response = requests.get(url, params=params)
-    return response.json()
+    return catalog.load(
+        f"search:movie:{query}", catalog.SEARCH_TTL,
+        lambda: tmdb_get("/search/movie", {"query": query}), snapshot=False
+    )
 
 
 @app.get("/search-tv")
 def search_tv(query: str):
-    url = "https://api.themoviedb.org/3/search/tv"
-    params = {"api_key": TMDB_API_KEY, "query": query}
-    response = requests.get(url, params=params)
-    return response.json()
+    return catalog.load(
+        f"search:tv:{query}", catalog.SEARCH_TTL,
+        lambda: tmdb_get("/search/tv", {"query": query}), snapshot=False
+    )
 
 
 # ====================== JIKAN ANIME ENDPOINTS ======================
 
 @app.get("/trending-anime")
 def get_trending_anime():
-    url = "https://api.jikan.moe/v4/top/anime"
-    params = {"limit": 20}
-    response = requests.get(url, params=params)
-    time.sleep(0.5)  # Rate limit
-    return response.json()
+    return catalog.trending("anime")
 
 
 @app.get("/search-anime")
 def search_anime(query: str):
-    url = "https://api.jikan.moe/v4/anime"
-    params = {"q": query, "limit": 20}
-    response = requests.get(url, params=params)
-    time.sleep(0.5)  # Rate limit
-    return response.json()
+    return catalog.load(
+        f"search:anime:{query}", catalog.SEARCH_TTL,
+        lambda: jikan_get("/anime", {"q": query, "limit": 20}), snapshot=False
+    )
 
 
 # ====================== MOOD RECOMMENDATIONS ======================
@@ -153,26 +231,28 @@ def get_recommendations(mood: str, content_type: str):
             "scary": 14, "thoughtful": 40, "relaxing": 36
         }
         genre_id = mood_genre_map_anime.get(mood, 1)
-        url = "https://api.jikan.moe/v4/anime"
         params = {"genres": genre_id, "order_by": "popularity", "limit": 20}
-        response = requests.get(url, params=params)
-        time.sleep(0.5)
-        return response.json()
+        return catalog.load(
+            f"recommend:anime:{genre_id}", catalog.RECOMMEND_TTL, lambda: jikan_get("/anime", params)
+        )
     else:
         genre_id = mood_genre_map.get(content_type, {}).get(mood, 28)
         endpoint = "movie" if content_type == "movies" else "tv"
-        url = f"https://api.themoviedb.org/3/discover/{endpoint}"
         params = {
-            "api_key": TMDB_API_KEY,
             "with_genres": genre_id,
             "sort_by": "popularity.desc"
         }
-        response = requests.get(url, params=params)
-        return response.json()
+        return catalog.load(
+            f"recommend:{endpoint}:{genre_id}", catalog.RECOMMEND_TTL,
+            lambda: tmdb_get(f"/discover/{endpoint}", params)
+        )
 
 
 # ====================== FAVORITES ENDPOINTS ======================
 
+FAVORITE_FIELDS = response_fields(FavoriteResponse)
+
+
 @app.post("/favorites", response_model=FavoriteResponse)
 def add_favorite(
     favorite: FavoriteCreate,
@@ -197,6 +277,10 @@ def add_favorite(
         poster_url=favorite.poster_url
     )
     db.add(new_favorite)
+    db.flush()
+    record_changes(db, current_user.id, change(
+        "favorite", "upsert", favorite.content_type, favorite.content_id, ref_id=new_favorite.id
+    ))
     
     # Create activity
     activity = Activity(
@@ -211,19 +295,24 @@ def add_favorite(
     
     db.commit()
     db.refresh(new_favorite)
+    feed_hub.publish(current_user.id, lambda: activity_to_dict(activity, current_user))
+    popularity.record(
+        "favorite", favorite.content_type, favorite.content_id, favorite.title, favorite.poster_url,
+        user_id=current_user.id
+    )
     return new_favorite
 
 
 @app.get("/favorites", response_model=List[FavoriteResponse])
 def get_favorites(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get user's favorites"""
-    favorites = db.query(Favorite).filter(
+    favorites = db.query(*columns(Favorite, FAVORITE_FIELDS)).filter(
         Favorite.user_id == current_user.id
     ).order_by(Favorite.added_at.desc()).all()
-    return favorites
+    return rows_response(favorites, FAVORITE_FIELDS)
 
 
 @app.get("/favorites/check/{content_type}/{content_id}")
@@ -231,7 +320,7 @@ def check_favorite(
     content_type: str,
     content_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Check if content is favorited"""
     favorite = db.query(Favorite).filter(
@@ -262,44 +351,33 @@ def delete_favorite(
         raise HTTPException(status_code=404, detail="Favorite not found")
     
     db.delete(favorite)
+    record_changes(db, current_user.id, change("favorite", "delete", favorite.content_type, favorite.content_id))
     db.commit()
     return {"message": "Favorite removed"}
 
 
 # ====================== HISTORY ENDPOINTS ======================
 
-@app.post("/history", response_model=HistoryResponse)
+HISTORY_FIELDS = response_fields(HistoryResponse)
+
+
+@app.post("/history", response_model=HistoryResponse, status_code=status.HTTP_202_ACCEPTED)
 def add_to_history(
     history: HistoryCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
-    """Add content to watch history"""
-    recent_time = datetime.utcnow() - timedelta(hours=24)
-    existing = db.query(History).filter(
-        History.user_id == current_user.id,
-        History.content_type == history.content_type,
-        History.content_id == history.content_id,
-        History.viewed_at >= recent_time
-    ).first()
-    
-    if existing:
-        existing.viewed_at = datetime.utcnow()
-        db.commit()
-        db.refresh(existing)
-        return existing
-    
-    new_history = History(
-        user_id=current_user.id,
-        content_type=history.content_type,
-        content_id=history.content_id,
-        title=history.title,
-        poster_url=history.poster_url
+    """Add content to watch history (written in the background)"""
+    popularity.record(
+        "view", history.content_type, history.content_id, history.title, history.poster_url,
+        user_id=current_user.id
+    )
+    return history_buffer.add(
+        current_user.id,
+        history.content_type,
+        history.content_id,
+        history.title,
+        history.poster_url
     )
-    db.add(new_history)
-    db.commit()
-    db.refresh(new_history)
-    return new_history
 
 
 @app.get("/history", response_model=List[HistoryResponse])
@@ -308,11 +386,21 @@ def get_history(
     db: Session = Depends(get_db),
     limit: int = 20
 ):
-    """Get watch history"""
-    history = db.query(History).filter(
+    """Get watch history, including views still waiting in the buffer"""
+    pending = history_buffer.pending_entries(current_user.id)
+    history = db.query(*columns(History, HISTORY_FIELDS)).filter(
         History.user_id == current_user.id
-    ).order_by(History.viewed_at.desc()).limit(limit).all()
-    return history
+    ).order_by(History.viewed_at.desc()).limit(limit + len(pending)).all()
+    if pending:
+        # A queued view replaces the stored row it will bump
+        queued = {(entry["content_type"], entry["content_id"]) for entry in pending}
+        history = sorted(
+            [tuple(entry[f] for f in HISTORY_FIELDS) for entry in pending] + [
+                row for row in history if (row.content_type, row.content_id) not in queued
+            ],
+            key=lambda row: row[HISTORY_FIELDS.index("viewed_at")], reverse=True
+        )
+    return rows_response(history[:limit], HISTORY_FIELDS)
 
 
 @app.delete("/history/all")
@@ -321,10 +409,12 @@ def delete_all_history(
     db: Session = Depends(get_db)
 ):
     """Clear all watch history"""
+    history_buffer.discard_user(current_user.id)
     try:
         deleted_count = db.query(History).filter(
             History.user_id == current_user.id
         ).delete()
+        record_changes(db, current_user.id, change("history", "clear"))
         db.commit()
         return {"message": f"All history cleared ({deleted_count} items deleted)"}
     except Exception as e:
@@ -348,12 +438,19 @@ def delete_history_item(
         raise HTTPException(status_code=404, detail="History item not found")
     
     db.delete(history_item)
+    db.flush()
+    record_changes(db, current_user.id, history_presence(
+        db, current_user.id, history_item.content_type, history_item.content_id
+    ))
     db.commit()
     return {"message": "History item deleted"}
 
 
 # ====================== RATINGS ENDPOINTS ======================
 
+RATING_FIELDS = response_fields(RatingResponse)
+
+
 @app.post("/ratings", response_model=RatingResponse)
 def add_or_update_rating(
     rating_data: RatingCreate,
@@ -368,11 +465,12 @@ def add_or_update_rating(
     ).first()
     
     if existing_rating:
+        apply_rating_change(
+            db, rating_data.content_type, rating_data.content_id, existing_rating.rating, rating_data.rating
+        )
         existing_rating.rating = rating_data.rating
         existing_rating.review = rating_data.review
         existing_rating.rated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(existing_rating)
         rating_to_return = existing_rating
     else:
         new_rating = Rating(
@@ -385,7 +483,15 @@ def add_or_update_rating(
             review=rating_data.review
         )
         db.add(new_rating)
+        db.flush()
+        apply_rating_change(db, rating_data.content_type, rating_data.content_id, new=rating_data.rating)
         rating_to_return = new_rating
+    review_search.index_rating(db, rating_to_return)
+
+    record_changes(db, current_user.id, change(
+        "rating", "upsert", rating_data.content_type, rating_data.content_id,
+        ref_id=rating_to_return.id, value=rating_data.rating
+    ))
     
     # Create activity for feed
     activity = Activity(
@@ -401,19 +507,25 @@ def add_or_update_rating(
     
     db.commit()
     db.refresh(rating_to_return)
+    taste.invalidate(current_user.id)
+    feed_hub.publish(current_user.id, lambda: activity_to_dict(activity, current_user))
+    popularity.record(
+        "rating", rating_data.content_type, rating_data.content_id, rating_data.title, rating_data.poster_url,
+        user_id=current_user.id
+    )
     return rating_to_return
 
 
 @app.get("/ratings", response_model=List[RatingResponse])
 def get_ratings(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     content_type: Optional[str] = Query(None),
     min_rating: Optional[float] = Query(None),
     sort_by: str = Query("rated_at")
 ):
     """Get all user ratings"""
-    query = db.query(Rating).filter(Rating.user_id == current_user.id)
+    query = db.query(*columns(Rating, RATING_FIELDS)).filter(Rating.user_id == current_user.id)
     
     if content_type:
         query = query.filter(Rating.content_type == content_type)
@@ -428,7 +540,7 @@ def get_ratings(
     else:
         query = query.order_by(Rating.rated_at.desc())
     
-    return query.all()
+    return rows_response(query.all(), RATING_FIELDS)
 
 
 @app.get("/ratings/{content_type}/{content_id}")
@@ -436,7 +548,7 @@ def get_rating(
     content_type: str,
     content_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get rating for specific content"""
     rating = db.query(Rating).filter(
@@ -472,12 +584,18 @@ def update_rating(
     if not rating:
         raise HTTPException(status_code=404, detail="Rating not found")
     
+    apply_rating_change(db, rating.content_type, rating.content_id, rating.rating, rating_update.rating)
     rating.rating = rating_update.rating
     rating.review = rating_update.review
     rating.rated_at = datetime.utcnow()
+    review_search.index_rating(db, rating)
+    record_changes(db, current_user.id, change(
+        "rating", "upsert", rating.content_type, rating.content_id, ref_id=rating.id, value=rating.rating
+    ))
     
     db.commit()
     db.refresh(rating)
+    taste.invalidate(current_user.id)
     return rating
 
 
@@ -497,14 +615,38 @@ def delete_rating(
         raise HTTPException(status_code=404, detail="Rating not found")
     
     db.delete(rating)
+    apply_rating_change(db, rating.content_type, rating.content_id, old=rating.rating)
+    review_search.unindex_ratings(db, [rating.id])
+    record_changes(db, current_user.id, change("rating", "delete", rating.content_type, rating.content_id))
     db.commit()
+    taste.invalidate(current_user.id)
     return {"message": "Rating deleted successfully"}
 
 
+@app.get("/reviews/search", response_model=ReviewSearchPage)
+def search_reviews(
+    q: str = Query(..., min_length=2, max_length=200),
+    content_type: Optional[str] = Query(None),
+    min_rating: Optional[float] = Query(None, ge=1, le=10),
+    page: int = Query(1, ge=1, le=50),
+    limit: int = Query(20, ge=1, le=50),
+    db: Session = Depends(get_read_db)
+):
+    """Full-text search over review text and titles, best match first"""
+    rows, has_next = review_search.search(
+        db, q, content_type=content_type, min_rating=min_rating, limit=limit, offset=(page - 1) * limit
+    )
+    results = [
+        dict({field: getattr(rating, field) for field in RATING_FIELDS}, username=username)
+        for rating, username in rows
+    ]
+    return {"results": results, "page": page, "has_next_page": has_next}
+
+
 @app.get("/ratings/stats")
 def get_ratings_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get rating statistics"""
     ratings = db.query(Rating).filter(Rating.user_id == current_user.id).all()
@@ -538,6 +680,92 @@ def get_ratings_stats(
     }
 
 
+# ====================== LIBRARY STATUS ======================
+
+@app.post("/library/status", response_model=List[LibraryStatus])
+def get_library_status(
+    request: LibraryStatusRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Favorite, rating, history and community state for a page of cards, one query per table"""
+    items = list(dict.fromkeys((item.content_type, item.content_id) for item in request.items))
+    if not items:
+        return []
+
+    def matches(model):
+        return (model.user_id == current_user.id, tuple_(model.content_type, model.content_id).in_(items))
+
+    favorites = {
+        (content_type, content_id): favorite_id
+        for favorite_id, content_type, content_id in db.query(
+            Favorite.id, Favorite.content_type, Favorite.content_id
+        ).filter(*matches(Favorite)).all()
+    }
+    ratings = {
+        (content_type, content_id): (rating_id, value)
+        for rating_id, content_type, content_id, value in db.query(
+            Rating.id, Rating.content_type, Rating.content_id, Rating.rating
+        ).filter(*matches(Rating)).all()
+    }
+    viewed = {
+        (content_type, content_id): viewed_at
+        for content_type, content_id, viewed_at in db.query(
+            History.content_type, History.content_id, func.max(History.viewed_at)
+        ).filter(*matches(History)).group_by(History.content_type, History.content_id).all()
+    }
+    # Views still waiting in the write-behind buffer are newer than any stored row
+    viewed.update(history_buffer.pending_views(current_user.id, items))
+    community = stats_for_many(db, items)
+
+    statuses = []
+    for key in items:
+        rating_id, value = ratings.get(key, (None, None))
+        statuses.append({
+            "content_type": key[0],
+            "content_id": key[1],
+            "is_favorite": key in favorites,
+            "favorite_id": favorites.get(key),
+            "has_rating": key in ratings,
+            "rating": value,
+            "rating_id": rating_id,
+            "last_viewed_at": viewed.get(key),
+            "community": community[key],
+        })
+    return ORJSONResponse(statuses)
+
+
+# ====================== LIBRARY SYNC ======================
+
+@app.get("/library/snapshot")
+def get_library_snapshot(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Whole library as ids and scores, with the version it reflects.
+
+    favorites: [content_type, content_id, favorite_id]
+    ratings: [content_type, content_id, rating, rating_id]
+    history: [content_type, content_id]
+    """
+    return ORJSONResponse(library.snapshot(db, current_user.id))
+
+
+@app.get("/library/changes")
+def get_library_changes(
+    since: int = Query(..., ge=0),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Changes and tombstones since a snapshot/changes version.
+
+    Each change is [kind, op, content_type, content_id, ref_id, value].
+    reset=true means the client is too far behind and should re-fetch
+    /library/snapshot.
+    """
+    return ORJSONResponse(library.changes_since(db, current_user.id, since))
+
+
 # ====================== SOCIAL FEATURES: FOLLOW SYSTEM ======================
 
 @app.post("/follow/{username}")
@@ -578,6 +806,8 @@ def follow_user(
     db.add(activity)
     
     db.commit()
+    feed_hub.follow(current_user.id, target_user.id)
+    feed_hub.publish(current_user.id, lambda: activity_to_dict(activity, current_user))
     return {"message": f"Now following {username}", "is_following": True}
 
 
@@ -602,6 +832,7 @@ def unfollow_user(
     
     db.delete(follow)
     db.commit()
+    feed_hub.unfollow(current_user.id, target_user.id)
     return {"message": f"Unfollowed {username}", "is_following": False}
 
 
@@ -609,7 +840,7 @@ def unfollow_user(
 def check_follow_status(
     username: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Check if current user follows target user"""
     target_user = db.query(User).filter(User.username == username).first()
@@ -624,17 +855,30 @@ def check_follow_status(
     return {"is_following": follow is not None}
 
 
+def _rank_by_taste(db: Session, user_id: int, people: List[dict]):
+    """people with taste_match filled in, best match first, unknown matches last"""
+    vectors = taste.vectors(db, [user_id] + [person["id"] for person in people])
+    viewer = vectors.pop(user_id)
+    scores = taste.match_many(viewer, vectors)
+    for person in people:
+        person["taste_match"] = scores[person["id"]]["match"]
+    return sorted(
+        people, key=lambda person: (person["taste_match"] is None, -(person["taste_match"] or 0), person["username"])
+    )
+
+
 @app.get("/followers", response_model=List[FollowerDetail])
 def get_followers(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    sort: str = Query("recent", pattern="^(recent|taste)$")
 ):
-    """Get list of users following current user"""
+    """Get list of users following current user; sort=taste ranks them by taste match"""
     followers = db.query(User, Follow).join(
         Follow, Follow.follower_id == User.id
     ).filter(Follow.following_id == current_user.id).all()
     
-    return [
+    people = [
         {
             "id": user.id,
             "username": user.username,
@@ -644,19 +888,21 @@ def get_followers(
         }
         for user, follow in followers
     ]
+    return _rank_by_taste(db, current_user.id, people) if sort == "taste" else people
 
 
 @app.get("/following", response_model=List[FollowerDetail])
 def get_following(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    sort: str = Query("recent", pattern="^(recent|taste)$")
 ):
-    """Get list of users current user is following"""
+    """Get list of users current user is following; sort=taste ranks them by taste match"""
     following = db.query(User, Follow).join(
         Follow, Follow.following_id == User.id
     ).filter(Follow.follower_id == current_user.id).all()
     
-    return [
+    people = [
         {
             "id": user.id,
             "username": user.username,
@@ -666,12 +912,13 @@ def get_following(
         }
         for user, follow in following
     ]
+    return _rank_by_taste(db, current_user.id, people) if sort == "taste" else people
 
 
 # ====================== PUBLIC USER PROFILES ======================
 
 @app.get("/users/{username}", response_model=UserPublicProfile)
-def get_user_profile(username: str, db: Session = Depends(get_db)):
+def get_user_profile(username: str, db: Session = Depends(get_read_db)):
     """Get public profile of any user"""
     user = db.query(User).filter(User.username == username).first()
     if not user:
@@ -694,17 +941,35 @@ def get_user_profile(username: str, db: Session = Depends(get_db)):
 
 
 @app.get("/users/{username}/ratings", response_model=List[RatingResponse])
-def get_user_ratings(username: str, db: Session = Depends(get_db), limit: int = 20):
+def get_user_ratings(username: str, db: Session = Depends(get_read_db), limit: int = 20):
     """Get public ratings of a user"""
     user = db.query(User).filter(User.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    ratings = db.query(Rating).filter(
+    ratings = db.query(*columns(Rating, RATING_FIELDS)).filter(
         Rating.user_id == user.id
     ).order_by(Rating.rated_at.desc()).limit(limit).all()
     
-    return ratings
+    return rows_response(ratings, RATING_FIELDS)
+
+
+@app.get("/users/{username}/taste-match")
+def get_taste_match(
+    username: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """How closely the current user's ratings agree with a user's.
+
+    Kept apart from the profile, which is cached publicly. match is None
+    until the two have rated taste.MIN_CO_RATED titles in common.
+    """
+    user = db.query(User.id).filter(User.username == username).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    vectors = taste.vectors(db, [current_user.id, user.id])
+    return dict(taste.match(vectors[current_user.id], vectors[user.id]), username=username)
 
 
 @app.put("/profile", response_model=UserResponse)
@@ -724,12 +989,64 @@ def update_profile(
     return current_user
 
 
+# ====================== ACCOUNT DELETION ======================
+
+@app.delete("/me", status_code=status.HTTP_202_ACCEPTED)
+def delete_account(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete the current account; rows are removed in the background.
+
+    The returned job_id is the only handle on the deletion once it is
+    accepted, since the account's tokens stop working immediately.
+    """
+    user_id = current_user.id
+    try:
+        job = request_deletion(db, current_user)
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Account deletion conflicted with another change; try again")
+    history_buffer.discard_user(user_id)
+    return deletion_progress(job)
+
+
+@app.get("/account-deletions/{job_id}")
+def get_account_deletion(job_id: str, db: Session = Depends(get_db)):
+    """Progress of an account deletion"""
+    job = db.query(AccountDeletion).filter(AccountDeletion.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    return deletion_progress(job)
+
+
 # ====================== ACTIVITY FEED ======================
 
+ACTIVITY_FIELDS = response_fields(ActivityResponse)
+ACTIVITY_USER_COLUMNS = {"username": User.username, "avatar_url": User.avatar_url}
+
+
+def activity_to_dict(activity: Activity, user: User):
+    return {
+        "id": activity.id,
+        "user_id": activity.user_id,
+        "username": user.username,
+        "avatar_url": user.avatar_url,
+        "activity_type": activity.activity_type,
+        "content_type": activity.content_type,
+        "content_id": activity.content_id,
+        "content_title": activity.content_title,
+        "content_poster": activity.content_poster,
+        "rating_value": activity.rating_value,
+        "target_user_id": activity.target_user_id,
+        "target_username": activity.target_username,
+        "created_at": activity.created_at
+    }
+
+
 @app.get("/feed", response_model=List[ActivityResponse])
 def get_activity_feed(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     limit: int = 50
 ):
     """Get activity feed from followed users"""
@@ -741,60 +1058,176 @@ def get_activity_feed(
     if not following_ids:
         return []
     
-    activities = db.query(Activity, User).join(
+    activities = db.query(*columns(Activity, ACTIVITY_FIELDS, ACTIVITY_USER_COLUMNS)).join(
         User, Activity.user_id == User.id
     ).filter(
         Activity.user_id.in_(following_ids)
     ).order_by(Activity.created_at.desc()).limit(limit).all()
     
-    return [
-        {
-            "id": activity.id,
-            "user_id": activity.user_id,
-            "username": user.username,
-            "avatar_url": user.avatar_url,
-            "activity_type": activity.activity_type,
-            "content_type": activity.content_type,
-            "content_id": activity.content_id,
-            "content_title": activity.content_title,
-            "content_poster": activity.content_poster,
-            "rating_value": activity.rating_value,
-            "target_user_id": activity.target_user_id,
-            "target_username": activity.target_username,
-            "created_at": activity.created_at
-        }
-        for activity, user in activities
-    ]
+    return rows_response(activities, ACTIVITY_FIELDS)
+
+
+def _load_following_ids(user_id: int):
+    db = SessionLocal()
+    try:
+        rows = db.query(Follow.following_id).filter(Follow.follower_id == user_id).all()
+        return [fid[0] for fid in rows]
+    finally:
+        db.close()
+
+
+def _load_feed_backlog(following_ids: List[int], last_event_id: int):
+    """(missed events, None), or (None, newest id) when more than RESUME_LIMIT were missed"""
+    db = SessionLocal()
+    try:
+        activities = db.query(Activity, User).join(
+            User, Activity.user_id == User.id
+        ).filter(
+            Activity.user_id.in_(following_ids),
+            Activity.id > last_event_id
+        ).order_by(Activity.id).limit(RESUME_LIMIT + 1).all()
+        if len(activities) > RESUME_LIMIT:
+            latest_id = db.query(func.max(Activity.id)).filter(Activity.user_id.in_(following_ids)).scalar()
+            return None, latest_id
+        return [activity_to_dict(activity, user) for activity, user in activities], None
+    finally:
+        db.close()
+
+
+async def _feed_events(request: Request, user_id: int, last_event_id: Optional[int]):
+    following_ids = await run_in_threadpool(_load_following_ids, user_id)
+    subscription = feed_hub.subscribe(user_id, following_ids)
+    try:
+        yield "retry: 3000\n\n"
+        last_sent = last_event_id or 0
+        
+        # Replay what the client missed while disconnected
+        if last_event_id is not None and following_ids:
+            backlog, latest_id = await run_in_threadpool(_load_feed_backlog, following_ids, last_event_id)
+            if backlog is None:
+                # Too much to replay: the client refetches the feed instead
+                yield format_resync(latest_id)
+                last_sent = latest_id
+            else:
+                for event in backlog:
+                    yield format_sse(event)
+                    last_sent = event["id"]
+        
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            
+            if event is RESYNC:
+                break
+            if event["id"] <= last_sent:
+                continue
+            yield format_sse(event)
+            last_sent = event["id"]
+    finally:
+        feed_hub.unsubscribe(subscription)
+
+
+@app.get("/feed/stream")
+def stream_activity_feed(
+    request: Request,
+    token: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[int] = Header(None)
+):
+    """Push activity from followed users as Server-Sent Events.
+    
+    EventSource cannot set headers, so the token may also be passed as ?token=.
+    A client that missed more than RESUME_LIMIT events gets a `resync` event
+    and should reload GET /feed.
+    """
+    if not token and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    db = SessionLocal()
+    try:
+        current_user = get_current_user(token, db)
+    finally:
+        db.close()
+    
+    return StreamingResponse(
+        _feed_events(request, current_user.id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ====================== COMMUNITY TRENDING ======================
+
+@app.get("/popular")
+def get_popular(
+    content_type: str = Query("movies", pattern="^(movies|tv|anime)$"),
+    window: str = Query("week"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """What MediaMingle users are viewing, favoriting and rating right now"""
+    if window not in POPULARITY_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(POPULARITY_WINDOWS)}")
+    return {
+        "content_type": content_type,
+        "window": window,
+        "results": popularity.top(content_type, window, limit)
+    }
 
 
 # ====================== DETAIL ENDPOINTS ======================
 
+def _with_community(content_type, content_id, db):
+    """Cached upstream details plus our users' rating stats.
+
+    The cached payload is shared between requests, so it is copied, not
+    modified.
+    """
+    payload = catalog.details(content_type, content_id)
+    return dict(payload, community=stats_for(db, content_type, str(content_id)))
+
+
 @app.get("/movie/{movie_id}")
-def get_movie_details(movie_id: int):
-    url = f"https://api.themoviedb.org/3/movie/{movie_id}"
-    params = {"api_key": TMDB_API_KEY, "append_to_response": "credits,videos,similar"}
-    response = requests.get(url, params=params)
-    return response.json()
+def get_movie_details(movie_id: int, db: Session = Depends(get_read_db)):
+    return _with_community("movies", movie_id, db)
 
 
 @app.get("/tv/{tv_id}")
-def get_tv_details(tv_id: int):
-    url = f"https://api.themoviedb.org/3/tv/{tv_id}"
-    params = {"api_key": TMDB_API_KEY, "append_to_response": "credits,videos,similar"}
-    response = requests.get(url, params=params)
-    return response.json()
+def get_tv_details(tv_id: int, db: Session = Depends(get_read_db)):
+    return _with_community("tv", tv_id, db)
 
 
 @app.get("/anime/{anime_id}")
-def get_anime_details(anime_id: int):
-    url = f"https://api.jikan.moe/v4/anime/{anime_id}/full"
-    response = requests.get(url)
-    time.sleep(0.5)
-    return response.json()
+def get_anime_details(anime_id: int, db: Session = Depends(get_read_db)):
+    return _with_community("anime", anime_id, db)
 
 
 # ====================== ADVANCED FILTER ENDPOINTS ======================
 
+def _tmdb_complete(item):
+    """Cards need a poster and a rating"""
+    return bool(item.get("poster_path")) and (item.get("vote_average") or 0) > 0
+
+
+def _tmdb_discover(kind, params, page):
+    source = DiscoverSource(
+        f"discover:{kind}:{catalog.params_key(params)}",
+        lambda upstream_page: tmdb_get(f"/discover/{kind}", dict(params, page=upstream_page)),
+        lambda payload: payload.get("results") or [],
+        # TMDB serves at most 500 pages
+        lambda payload, upstream_page: upstream_page < min(payload.get("total_pages") or 0, 500),
+        _tmdb_complete,
+    )
+    results, has_next = serve_page(source, page)
+    return {"page": page, "results": results, "has_next_page": has_next}
+
+
 @app.get("/discover-movies")
 def discover_movies(
     year_min: int = Query(1900),
@@ -803,24 +1236,20 @@ def discover_movies(
     language: str = Query(""),
     sort_by: str = Query("popularity.desc"),
     with_genres: str = Query(""),
-    page: int = Query(1)
+    page: int = Query(1, ge=1)
 ):
-    url = "https://api.themoviedb.org/3/discover/movie"
     params = {
-        "api_key": TMDB_API_KEY,
         "primary_release_date.gte": f"{year_min}-01-01",
         "primary_release_date.lte": f"{year_max}-12-31",
         "vote_average.gte": rating_min,
-        "sort_by": sort_by,
-        "page": page
+        "sort_by": sort_by
     }
     if language:
         params["with_original_language"] = language
     if with_genres:
         params["with_genres"] = with_genres
     
-    response = requests.get(url, params=params)
-    return response.json()
+    return _tmdb_discover("movie", params, page)
 
 
 @app.get("/discover-tv")
@@ -831,24 +1260,25 @@ def discover_tv(
     language: str = Query(""),
     sort_by: str = Query("popularity.desc"),
     with_genres: str = Query(""),
-    page: int = Query(1)
+    page: int = Query(1, ge=1)
 ):
-    url = "https://api.themoviedb.org/3/discover/tv"
     params = {
-        "api_key": TMDB_API_KEY,
         "first_air_date.gte": f"{year_min}-01-01",
         "first_air_date.lte": f"{year_max}-12-31",
         "vote_average.gte": rating_min,
-        "sort_by": sort_by,
-        "page": page
+        "sort_by": sort_by
     }
     if language:
         params["with_original_language"] = language
     if with_genres:
         params["with_genres"] = with_genres
     
-    response = requests.get(url, params=params)
-    return response.json()
+    return _tmdb_discover("tv", params, page)
+
+
+def _anime_year(item):
+    aired_from = (item.get("aired") or {}).get("from")
+    return int(aired_from[:4]) if aired_from else item.get("year")
 
 
 @app.get("/discover-anime")
@@ -858,24 +1288,27 @@ def discover_anime(
     rating_min: float = Query(0.0),
     genre: str = Query(None),
     sort_by: str = Query("popularity"),
-    page: int = Query(1)
+    page: int = Query(1, ge=1)
 ):
+    # (order_by, sort) for Jikan
     sort_map = {
-        "POPULARITY_DESC": "popularity",
-        "SCORE_DESC": "score",
-        "START_DATE_DESC": "start_date",
-        "START_DATE": "start_date",
-        "TITLE_ROMAJI": "title",
-        "popularity.desc": "popularity",
-        "vote_average.desc": "score"
+        "POPULARITY_DESC": ("popularity", "asc"),  # Jikan ranks popularity 1 = most popular
+        "SCORE_DESC": ("score", "desc"),
+        "START_DATE_DESC": ("start_date", "desc"),
+        "START_DATE": ("start_date", "asc"),
+        "TITLE_ROMAJI": ("title", "asc"),
+        "popularity.desc": ("popularity", "asc"),
+        "vote_average.desc": ("score", "desc")
     }
+    order_by, sort = sort_map.get(sort_by, ("popularity", "asc"))
     
-    url = "https://api.jikan.moe/v4/anime"
     params = {
-        "order_by": sort_map.get(sort_by, "popularity"),
-        "sort": "desc",
-        "limit": 20,
-        "page": page
+        "order_by": order_by,
+        "sort": sort,
+        "limit": 25,
+        # Jikan's end_date bounds when a show finished airing, which would drop
+        # ongoing series; year_max is applied to the start year below instead
+        "start_date": f"{year_min}-01-01"
     }
     
     if rating_min > 0:
@@ -892,31 +1325,114 @@ def discover_anime(
         genre_id = genre_map.get(genre)
         if genre_id:
             params["genres"] = genre_id
-    
-    try:
-        response = requests.get(url, params=params)
-        time.sleep(0.5)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"data": []}
-    except Exception as e:
-        print(f"Jikan API error: {e}")
-        return {"data": []}
+
+    def keep(item):
+        year = _anime_year(item)
+        return (
+            bool(((item.get("images") or {}).get("jpg") or {}).get("image_url"))
+            and (item.get("score") or 0) > 0
+            and year is not None and year_min <= year <= year_max
+        )
+
+    source = DiscoverSource(
+        f"discover:anime:{catalog.params_key(params)}",
+        lambda upstream_page: jikan_get("/anime", dict(params, page=upstream_page)),
+        lambda payload: payload.get("data") or [],
+        lambda payload, upstream_page: bool((payload.get("pagination") or {}).get("has_next_page")),
+        keep,
+        page_size=params["limit"],
+    )
+    data, has_next = serve_page(source, page)
+    return {"data": data, "pagination": {"current_page": page, "has_next_page": has_next}}
 
 
 @app.get("/movie-genres")
 def get_movie_genres():
-    url = "https://api.themoviedb.org/3/genre/movie/list"
-    params = {"api_key": TMDB_API_KEY}
-    return requests.get(url, params=params).json()
+    return catalog.genres("movie")
 
 
 @app.get("/tv-genres")
 def get_tv_genres():
-    url = "https://api.themoviedb.org/3/genre/tv/list"
-    params = {"api_key": TMDB_API_KEY}
-    return requests.get(url, params=params).json()
+    return catalog.genres("tv")
+
+
+# ====================== IMAGE PROXY ======================
+
+@app.get("/img")
+def get_image(
+    request: Request,
+    url: str,
+    w: int = Query(185, ge=1),
+    fmt: Optional[str] = Query(None)
+):
+    """Serve a poster as a cached fixed-width WebP/JPEG thumbnail"""
+    if fmt is None:
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    if fmt not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported image format")
+    
+    try:
+        data = image_cache.get(url, snap_width(w), fmt)
+    except ImageProxyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    etag = content_etag(data)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        byte_range = parse_range(request.headers.get("range"), len(data))
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{len(data)}"})
+    
+    media_type = IMAGE_FORMATS[fmt][1]
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        return Response(data[start:end + 1], status_code=206, headers=headers, media_type=media_type)
+    return Response(data, headers=headers, media_type=media_type)
+
+
+# ====================== METRICS ======================
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics in the text exposition format"""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    metrics.THREADPOOL_IN_USE.set(limiter.borrowed_tokens)
+    metrics.THREADPOOL_TOTAL.set(limiter.total_tokens)
+    return PlainTextResponse(metrics.render_all(), media_type="text/plain; version=0.0.4")
+
+
+# ====================== PROFILES ======================
+
+def _require_profile_admin(token: Optional[str]):
+    # 404 rather than 401 so the endpoints are not advertised
+    if not PROFILING_ENABLED or not profiling.is_admin(token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.get("/debug/profiles")
+def get_profiles(x_profile_token: Optional[str] = Header(None)):
+    """Stored request profiles, newest first"""
+    _require_profile_admin(x_profile_token)
+    return profiling.list_profiles()
+
+
+@app.get("/debug/profiles/{name}", response_class=PlainTextResponse)
+def get_profile(name: str, x_profile_token: Optional[str] = Header(None)):
+    """One profile as collapsed stacks, ready for flamegraph.pl or speedscope"""
+    _require_profile_admin(x_profile_token)
+    collapsed = profiling.read_profile(name)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(collapsed)
 
 
 # ====================== HEALTH CHECK ======================
@@ -0,0 +1,95 @@
+"""Schema and maintenance commands, kept out of the serving path.
+
+    python manage.py init-db          # create missing tables and indexes
+    python manage.py check-db         # verify the database is reachable
+    python manage.py recompute-stats  # rebuild content_stats from ratings
+    python manage.py delete-accounts  # finish queued account deletions now
+    python manage.py reindex-reviews  # rebuild the SQLite review search table
+"""
+import argparse
+import sys
+import time
+
+from sqlalchemy import text
+
+
+def init_db_command(args):
+    from database import init_db
+
+    start = time.perf_counter()
+    init_db()
+    print(f"Schema up to date in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def check_db_command(args):
+    from database import get_engine
+
+    start = time.perf_counter()
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+    print(f"Database reachable in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def recompute_stats_command(args):
+    from content_stats import recompute
+    from database import SessionLocal
+
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        count = recompute(db)
+    finally:
+        db.close()
+    print(f"Recomputed stats for {count} titles in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def delete_accounts_command(args):
+    from account_deletion import run_pending
+    from database import SessionLocal, AccountDeletion
+
+    start = time.perf_counter()
+    run_pending(budget=float("inf"))
+    db = SessionLocal()
+    try:
+        left = db.query(AccountDeletion).filter(AccountDeletion.status != "done").count()
+    finally:
+        db.close()
+    print(f"Account deletions processed in {(time.perf_counter() - start) * 1000:.0f} ms, {left} still queued")
+
+
+def reindex_reviews_command(args):
+    from database import SessionLocal
+    from review_search import rebuild
+
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        rebuild(db)
+    finally:
+        db.close()
+    print(f"Review search rebuilt in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+COMMANDS = {
+    "init-db": init_db_command,
+    "check-db": check_db_command,
+    "recompute-stats": recompute_stats_command,
+    "delete-accounts": delete_accounts_command,
+    "reindex-reviews": reindex_reviews_command,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MediaMingle maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("init-db", help="Create missing tables and indexes")
+    subparsers.add_parser("check-db", help="Verify the database is reachable")
+    subparsers.add_parser("recompute-stats", help="Rebuild community rating stats from the ratings table")
+    subparsers.add_parser("delete-accounts", help="Run queued account deletions to completion")
+    subparsers.add_parser("reindex-reviews", help="Rebuild the SQLite review search table after bulk loads")
+    args = parser.parse_args(argv)
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
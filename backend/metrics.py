@@ -0,0 +1,264 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+import threading
+import time
+
+# Seconds; shared by request, upstream and job timings
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class for metrics exposed in the Prometheus text format.
+
+    Label values are passed positionally in labelnames order, which keeps the
+    hot path to a tuple lookup under a lock.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                series = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for labelvalues, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render_all():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ====================== INSTRUMENTS ======================
+
+HTTP_REQUESTS = Counter(
+    "mediamingle_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "mediamingle_http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+HTTP_IN_PROGRESS = Gauge("mediamingle_http_requests_in_progress", "HTTP requests currently being served")
+
+UPSTREAM_REQUESTS = Counter(
+    "mediamingle_upstream_requests_total", "Upstream API calls by host and status", ("host", "status")
+)
+UPSTREAM_DURATION = Histogram(
+    "mediamingle_upstream_request_duration_seconds", "Upstream API call latency", ("host",)
+)
+RATE_LIMIT_WAIT = Histogram(
+    "mediamingle_rate_limiter_wait_seconds", "Time spent waiting on upstream rate limiters", ("host",)
+)
+
+UPSTREAM_RETRIES = Counter(
+    "mediamingle_upstream_retries_total", "Upstream API retries by host and reason", ("host", "reason")
+)
+UPSTREAM_HEDGES = Counter(
+    "mediamingle_upstream_hedges_total", "Hedged upstream requests sent and won", ("host", "outcome")
+)
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    "mediamingle_upstream_circuit_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)", ("host",)
+)
+
+RATE_LIMITED = Counter(
+    "mediamingle_rate_limited_requests_total", "Inbound requests rejected with 429", ("budget", "identity")
+)
+
+HISTORY_DROPPED = Counter(
+    "mediamingle_history_dropped_total", "Views not queued because the history buffer was full"
+)
+
+CACHE_REQUESTS = Counter(
+    "mediamingle_cache_requests_total", "Cache lookups by cache and result", ("cache", "result")
+)
+
+DB_QUERY_DURATION = Histogram("mediamingle_db_query_duration_seconds", "Duration of individual SQL statements")
+DB_QUERIES_PER_REQUEST = Histogram(
+    "mediamingle_db_queries_per_request", "SQL statements issued per HTTP request", ("route",),
+    buckets=QUERY_COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "mediamingle_db_time_per_request_seconds", "Total SQL time per HTTP request", ("route",)
+)
+DB_READS = Counter(
+    "mediamingle_db_reads_total", "Read-only sessions by database served and reason", ("target", "reason")
+)
+DB_REPLICA_LAG = Gauge(
+    "mediamingle_db_replica_lag_seconds", "Replication lag seen at the last check (-1 when unreachable)", ("replica",)
+)
+
+THREADPOOL_IN_USE = Gauge("mediamingle_threadpool_tokens_in_use", "Worker threads busy running sync handlers")
+THREADPOOL_TOTAL = Gauge("mediamingle_threadpool_tokens_total", "Size of the sync handler thread pool")
+
+SCHEDULER_JOB_DURATION = Histogram(
+    "mediamingle_scheduler_job_duration_seconds", "Background job run time", ("job",)
+)
+SCHEDULER_JOB_RUNS = Counter(
+    "mediamingle_scheduler_job_runs_total", "Background job runs by result", ("job", "result")
+)
+
+ACCOUNT_DELETION_ROWS = Counter(
+    "mediamingle_account_deletion_rows_total", "Rows removed by account deletion jobs", ("table",)
+)
+
+STARTUP_DURATION = Gauge(
+    "mediamingle_startup_phase_seconds", "Time spent in each startup phase of this worker", ("phase",)
+)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+# ====================== PER-REQUEST CONTEXT ======================
+
+class RequestStats:
+    """Counters collected while serving one request"""
+
+    __slots__ = ("scope", "query_count", "query_time", "statements")
+
+    def __init__(self, scope=None):
+        self.scope = scope
+        self.query_count = 0
+        self.query_time = 0.0
+        self.statements = {}  # statement text -> executions in this request
+
+
+# Set by MetricsMiddleware; worker threads running sync handlers inherit a
+# copy of the context, so they share the same RequestStats object.
+current_request = ContextVar("current_request", default=None)
+
+
+def record_query(elapsed):
+    DB_QUERY_DURATION.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.query_count += 1
+        stats.query_time += elapsed
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, status and DB usage"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_PROGRESS.dec()
+            current_request.reset(token)
+
+            # FastAPI stores the matched route in the scope, giving us the
+            # path template rather than one series per id
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, path, str(status_code))
+            HTTP_REQUEST_DURATION.observe(elapsed, method, path)
+            DB_QUERIES_PER_REQUEST.observe(stats.query_count, path)
+            DB_TIME_PER_REQUEST.observe(stats.query_time, path)
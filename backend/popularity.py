@@ -0,0 +1,245 @@
+from datetime import datetime, timedelta, timezone
+import heapq
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import func
+
+from cache import TTLCache
+from database import SessionLocal, History, Activity
+
+logger = logging.getLogger(__name__)
+
+# Half-life of a view/favorite/rating in each trending window, in seconds
+HALF_LIVES = {"day": 6 * 3600, "week": 2 * 86400}
+# Events older than this barely register in any window and are not reloaded
+HORIZON = timedelta(days=14)
+WEIGHTS = {"view": 1.0, "favorite": 3.0, "rating": 2.0}
+CONTENT_TYPES = ("movies", "tv", "anime")
+
+TOP_N = 100
+TOP_REFRESH_SECONDS = 30  # how stale a materialized top list may get
+MIN_SCORE = 0.01  # decayed scores below this are dropped
+# Each worker only sees its own writes; events other workers stored since
+# the last pass are read from the database this often so workers converge
+RECONCILE_SECONDS = float(os.getenv("POPULARITY_RECONCILE_SECONDS", "60"))
+# A user counts at most once per event and title within this window, the
+# same window the history buffer uses to merge repeat views
+COUNT_WINDOW = 24 * 3600
+COUNTED_ENTRIES = int(os.getenv("POPULARITY_COUNTED_ENTRIES", "200000"))
+REBASE_HALF_LIVES = 64
+
+
+class PopularityTracker:
+    """Time-decayed popularity of titles, kept in memory.
+
+    A score decays as 2^(-age / half_life). Instead of decaying every entry
+    over time, new events are added with weight 2^((t - epoch) / half_life),
+    which preserves ordering; the epoch is moved forward (rescaling every
+    entry once) before the numbers grow large. Top lists per content type
+    and window are materialized at most every TOP_REFRESH_SECONDS.
+
+    Scores are loaded from the database once at start; after that only rows
+    past the last seen History/Activity ids are read. Events carry the user,
+    so a view or favorite this worker already counted is not counted again
+    when its row comes back from the database, nor when the user repeats it.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._scores = self._empty_scores()
+        self._info = {}  # (content_type, content_id) -> (title, poster_url)
+        self._epoch = time.time()
+        self._top = {}  # (content_type, window) -> (built_at, entries)
+        self._counted = self._new_counted()  # (user_id, event, content_type, content_id)
+        self._watermarks = None  # (history id, activity id) read so far
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _empty_scores():
+        return {(ct, window): {} for ct in CONTENT_TYPES for window in HALF_LIVES}
+
+    @staticmethod
+    def _new_counted():
+        return TTLCache("popularity_counted", max_entries=COUNTED_ENTRIES)
+
+    @staticmethod
+    def _first_count(counted, user_id, event, content_type, content_id, at):
+        """Whether this is the user's first such event in COUNT_WINDOW; marks it"""
+        if user_id is None:
+            return True
+        key = (user_id, event, content_type, content_id)
+        if counted.get(key, record=False) is not None:
+            return False
+        remaining = COUNT_WINDOW - (time.time() - at)
+        if remaining > 0:
+            counted.set(key, True, remaining)
+        return True
+
+    @staticmethod
+    def _add(scores, epoch, event, content_type, content_id, at):
+        for window, half_life in HALF_LIVES.items():
+            bucket = scores.get((content_type, window))
+            if bucket is None:
+                return
+            bucket[content_id] = bucket.get(content_id, 0.0) + WEIGHTS[event] * 2 ** ((at - epoch) / half_life)
+
+    def record(self, event, content_type, content_id, title=None, poster_url=None, at=None, user_id=None):
+        """Count one view/favorite/rating of a title, once per user in COUNT_WINDOW"""
+        at = time.time() if at is None else at
+        with self._lock:
+            if not self._first_count(self._counted, user_id, event, content_type, content_id, at):
+                return
+            self._maybe_rebase(at)
+            self._add(self._scores, self._epoch, event, content_type, content_id, at)
+            if title is not None:
+                self._info[(content_type, content_id)] = (title, poster_url)
+
+    def _maybe_rebase(self, now):
+        if (now - self._epoch) / min(HALF_LIVES.values()) > REBASE_HALF_LIVES:
+            self._rebase(now)
+
+    def _rebase(self, now):
+        """Move the epoch to now, rescaling scores and dropping faded ones"""
+        for (content_type, window), bucket in self._scores.items():
+            factor = 2 ** (-(now - self._epoch) / HALF_LIVES[window])
+            for key in list(bucket):
+                bucket[key] *= factor
+                if bucket[key] < MIN_SCORE:
+                    del bucket[key]
+        self._epoch = now
+        self._top.clear()
+        live = {(ct, cid) for (ct, _), bucket in self._scores.items() for cid in bucket}
+        self._info = {key: value for key, value in self._info.items() if key in live}
+
+    def top(self, content_type, window, limit=20):
+        """Highest-scoring titles as dicts, best first"""
+        now = time.time()
+        with self._lock:
+            self._maybe_rebase(now)
+            cached = self._top.get((content_type, window))
+            if cached is None or now - cached[0] > TOP_REFRESH_SECONDS:
+                bucket = self._scores[(content_type, window)]
+                factor = 2 ** (-(now - self._epoch) / HALF_LIVES[window])
+                entries = []
+                for content_id, score in heapq.nlargest(TOP_N, bucket.items(), key=lambda item: item[1]):
+                    title, poster_url = self._info.get((content_type, content_id), (None, None))
+                    entries.append({
+                        "content_type": content_type,
+                        "content_id": content_id,
+                        "title": title,
+                        "poster_url": poster_url,
+                        "score": round(score * factor, 3),
+                    })
+                cached = self._top[(content_type, window)] = (now, entries)
+        return cached[1][:limit]
+
+    def _events(self, db, history_after=None, activity_after=None, since=None):
+        """(id kind, row id, user_id, event, content_type, content_id, title, poster_url, at) rows"""
+        views = db.query(
+            History.id, History.user_id, History.content_type, History.content_id,
+            History.title, History.poster_url, History.viewed_at
+        )
+        actions = db.query(
+            Activity.id, Activity.user_id, Activity.activity_type, Activity.content_type,
+            Activity.content_id, Activity.content_title, Activity.content_poster, Activity.created_at
+        ).filter(Activity.activity_type.in_(("favorite", "rating")))
+        if since is not None:
+            views = views.filter(History.viewed_at >= since)
+            actions = actions.filter(Activity.created_at >= since)
+        if history_after is not None:
+            views = views.filter(History.id > history_after)
+            actions = actions.filter(Activity.id > activity_after)
+
+        for row_id, user_id, content_type, content_id, title, poster_url, viewed_at in views.yield_per(5000):
+            yield "history", row_id, user_id, "view", content_type, content_id, title, poster_url, _timestamp(viewed_at)
+        for row_id, user_id, event, content_type, content_id, title, poster_url, created_at in actions.yield_per(5000):
+            yield "activity", row_id, user_id, event, content_type, content_id, title, poster_url, _timestamp(created_at)
+
+    def reload(self):
+        """Rebuild scores from views and activity within HORIZON"""
+        since = datetime.utcnow() - HORIZON
+        epoch = time.time()
+        db = self._session_factory()
+        try:
+            # Read before the scan: rows stored during it are picked up by catch_up()
+            watermarks = (
+                db.query(func.max(History.id)).scalar() or 0,
+                db.query(func.max(Activity.id)).scalar() or 0,
+            )
+            scores, info, counted = self._empty_scores(), {}, self._new_counted()
+            for kind, row_id, user_id, event, content_type, content_id, title, poster_url, at in self._events(
+                db, since=since
+            ):
+                if row_id > watermarks[kind == "activity"]:
+                    continue
+                if self._first_count(counted, user_id, event, content_type, content_id, at):
+                    self._add(scores, epoch, event, content_type, content_id, at)
+                    info[(content_type, content_id)] = (title, poster_url)
+        finally:
+            db.close()
+
+        # Events recorded while this ran are dropped; catch_up() re-reads them
+        with self._lock:
+            self._scores = scores
+            self._info = info
+            self._counted = counted
+            self._epoch = epoch
+            self._top.clear()
+            self._watermarks = watermarks
+
+    def catch_up(self):
+        """Add the events stored since the last pass, by this or any other worker.
+
+        A row whose id was allocated before the watermark but committed after
+        it was read is missed; that only loses one event's weight.
+        """
+        history_after, activity_after = self._watermarks
+        db = self._session_factory()
+        try:
+            rows = list(self._events(db, history_after, activity_after))
+        finally:
+            db.close()
+        for kind, row_id, user_id, event, content_type, content_id, title, poster_url, at in rows:
+            if kind == "history":
+                history_after = max(history_after, row_id)
+            else:
+                activity_after = max(activity_after, row_id)
+            self.record(event, content_type, content_id, title, poster_url, at=at, user_id=user_id)
+        with self._lock:
+            self._watermarks = (history_after, activity_after)
+
+    def _run(self):
+        while True:
+            try:
+                if self._watermarks is None:
+                    self.reload()
+                else:
+                    self.catch_up()
+            except Exception:
+                logger.exception("Failed to update popularity scores")
+            if self._stopped.wait(RECONCILE_SECONDS):
+                return
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="popularity", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def _timestamp(naive_utc):
+    return naive_utc.replace(tzinfo=timezone.utc).timestamp() if naive_utc else time.time()
+
+
+popularity = PopularityTracker()
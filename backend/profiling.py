@@ -0,0 +1,214 @@
+from collections import Counter
+from contextvars import Context, ContextVar
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# The middleware is only installed when PROFILING_ENABLED=1. A request is
+# profiled when it carries X-Profile-Token matching PROFILING_TOKEN, or when
+# it is picked by PROFILING_SAMPLE_RATE (0.0 - 1.0).
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "") == "1"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "mediamingle-profiles"))
+MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "50"))
+INTERVAL = float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000
+MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "30"))  # streaming responses stop being sampled here
+
+TOKEN_HEADER = b"x-profile-token"
+SKIP_PREFIX = "/debug/profiles"  # reading profiles should not push them out of the ring
+MAX_DEPTH = 64
+
+# Set for the duration of a profiled request; sync handlers run with a copy
+# of the request's context, which is how their worker threads are found
+_active_profile = ContextVar("active_profile", default=None)
+_write_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Wall-clock sampler for one request.
+
+    Every INTERVAL seconds the stacks of the request's threads are recorded:
+    any worker thread whose stack shows it running a context that belongs to
+    the request, and the event loop thread whenever it is not idle (async
+    work of concurrent requests shows up there too).
+    Samples are kept as collapsed stacks ("a;b;c count"), the input format
+    of flamegraph tools.
+    """
+
+    def __init__(self, loop_thread):
+        self.loop_thread = loop_thread
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        deadline = time.perf_counter() + MAX_SECONDS
+        own = threading.get_ident()
+        while not self._stopped.wait(INTERVAL) and time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident == self.loop_thread:
+                    if _is_idle(frame):
+                        continue
+                    self._record("[event loop]", frame)
+                elif self._serves_request(frame):
+                    self._record("[worker]", frame)
+
+    def _serves_request(self, frame):
+        # anyio's worker threads call context.run(func) with the caller's copied context
+        while frame is not None:
+            context = frame.f_locals.get("context") if "context" in frame.f_code.co_varnames else None
+            if isinstance(context, Context):
+                return context.get(_active_profile) is self
+            frame = frame.f_back
+        return False
+
+    def _record(self, root, frame):
+        names = []
+        while frame is not None and len(names) < MAX_DEPTH:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        names.append(root)
+        self.stacks[";".join(reversed(names))] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _is_idle(frame):
+    """True when the event loop is waiting in select() for work"""
+    return frame.f_code.co_name == "select" and frame.f_back is not None \
+        and frame.f_back.f_code.co_name == "_run_once"
+
+
+def _slug(path):
+    return re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-")[:60] or "root"
+
+
+def save(profiler, method, route, status):
+    """Write a profile into PROFILE_DIR, dropping the oldest beyond MAX_PROFILES"""
+    now = time.time()
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"{int(now * 1000) % 1000:03d}"
+    name = f"{stamp}-{os.urandom(2).hex()}-{method}-{_slug(route)}"
+    header = {
+        "method": method,
+        "route": route,
+        "status": status,
+        "duration_ms": round(profiler.duration * 1000, 1),
+        "samples": profiler.samples,
+        "interval_ms": INTERVAL * 1000,
+    }
+    with _write_lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, name + ".folded"), "w") as f:
+            f.write("# " + json.dumps(header) + "\n")
+            f.write(profiler.collapsed())
+        for old in sorted(os.listdir(PROFILE_DIR))[:-MAX_PROFILES]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old))
+            except OSError:
+                pass
+    return name
+
+
+def list_profiles():
+    """Stored profiles, newest first, with the summary from their first line"""
+    try:
+        names = sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".folded")), reverse=True)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                header = json.loads(f.readline()[2:])
+        except (OSError, ValueError):
+            continue
+        profiles.append(dict(header, name=name[:-len(".folded")]))
+    return profiles
+
+
+def read_profile(name):
+    """Collapsed stacks of one profile, or None if it is gone"""
+    if not re.fullmatch(r"[A-Za-z0-9-]+", name):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, name + ".folded")) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def is_admin(token):
+    return bool(PROFILING_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+class ProfilingMiddleware:
+    """Profile requests picked by the admin header or the sample rate"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _triggered(self, scope):
+        if scope["path"].startswith(SKIP_PREFIX):
+            return False
+        if SAMPLE_RATE and random.random() < SAMPLE_RATE:
+            return True
+        if not PROFILING_TOKEN:
+            return False
+        for name, value in scope["headers"]:
+            if name == TOKEN_HEADER:
+                return is_admin(value.decode("latin-1"))
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._triggered(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler(threading.get_ident())
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = _active_profile.set(profiler)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            _active_profile.reset(token)
+            route = getattr(scope.get("route"), "path", scope["path"])
+            try:
+                await run_in_threadpool(save, profiler, scope["method"], route, status)
+            except OSError:
+                logger.exception("Failed to store profile of %s %s", scope["method"], route)
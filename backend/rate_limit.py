@@ -0,0 +1,161 @@
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from jose import JWTError, jwt
+import math
+import os
+import threading
+import time
+
+from auth import SECRET_KEY, ALGORITHM
+import metrics
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # seconds
+
+# Requests per window; routes that call TMDB/Jikan get the tighter budget.
+# "ip" covers anonymous requests from an address, "ip_users" everything its
+# signed-in accounts send together, so extra accounts do not add quota.
+BUDGETS = {
+    "upstream": {
+        "user": int(os.getenv("RATE_LIMIT_UPSTREAM_USER", "120")),
+        "ip": int(os.getenv("RATE_LIMIT_UPSTREAM_IP", "60")),
+        "ip_users": int(os.getenv("RATE_LIMIT_UPSTREAM_IP_USERS", "480")),
+    },
+    "db": {
+        "user": int(os.getenv("RATE_LIMIT_DB_USER", "600")),
+        "ip": int(os.getenv("RATE_LIMIT_DB_IP", "300")),
+        "ip_users": int(os.getenv("RATE_LIMIT_DB_IP_USERS", "2400")),
+    },
+}
+
+UPSTREAM_PREFIXES = (
+    "/trending-", "/search-", "/discover-", "/recommend", "/movie/", "/tv/", "/anime/",
+    "/movie-genres", "/tv-genres",
+)  # /img is left out: most posters come from the disk cache
+EXEMPT_PATHS = {"/", "/metrics"}
+
+
+def _retry_after(previous, current, limit, window, elapsed):
+    """Seconds until one more request fits under the sliding window"""
+    if current + 1 > limit or previous == 0:
+        return window - elapsed
+    # The previous window's weight decays linearly; wait until enough of it is gone
+    wait = window - elapsed - (limit - current - 1) * window / previous
+    return max(1.0, wait)
+
+
+class InMemoryBackend:
+    """Sliding-window counters for a single process"""
+
+    def __init__(self):
+        self._windows = {}  # key -> (window index, current count, previous count)
+        self._lock = threading.Lock()
+
+    async def hit(self, key, limit, window):
+        now = time.time()
+        index = int(now // window)
+        elapsed = now - index * window
+        with self._lock:
+            start, current, previous = self._windows.get(key, (index, 0, 0))
+            if start != index:
+                previous = current if start == index - 1 else 0
+                current = 0
+            weighted = previous * (window - elapsed) / window + current
+            if weighted + 1 > limit:
+                self._windows[key] = (index, current, previous)
+                return _retry_after(previous, current, limit, window, elapsed)
+            self._windows[key] = (index, current + 1, previous)
+            if len(self._windows) > 100000:
+                self._purge(index)
+        return 0
+
+    def _purge(self, index):
+        for key in [k for k, v in self._windows.items() if v[0] < index - 1]:
+            del self._windows[key]
+
+
+class RedisBackend:
+    """Sliding-window counters shared by every worker through Redis"""
+
+    def __init__(self, url):
+        import redis.asyncio
+
+        self._redis = redis.asyncio.from_url(url)
+
+    async def hit(self, key, limit, window):
+        now = time.time()
+        index = int(now // window)
+        elapsed = now - index * window
+        current_key = f"ratelimit:{key}:{index}"
+
+        pipe = self._redis.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, window * 2)
+        pipe.get(f"ratelimit:{key}:{index - 1}")
+        current, _, previous = await pipe.execute()
+        previous = int(previous or 0)
+
+        if previous * (window - elapsed) / window + current > limit:
+            await self._redis.decr(current_key)
+            return _retry_after(previous, current - 1, limit, window, elapsed)
+        return 0
+
+
+def _client_identities(headers, scope):
+    """(kind, identity) counters a request is charged to.
+
+    Anonymous requests count against ('ip', address). With a valid bearer
+    token they count against ('user', subject) and ('ip_users', address).
+    """
+    # Render's proxy appends the real client address as the last hop
+    forwarded = headers.get("x-forwarded-for")
+    if forwarded:
+        address = forwarded.split(",")[-1].strip()
+    else:
+        client = scope.get("client")
+        address = client[0] if client else "unknown"
+
+    authorization = headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            subject = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+            if subject:
+                return [("user", subject), ("ip_users", address)]
+        except JWTError:
+            pass
+    return [("ip", address)]
+
+
+class RateLimitMiddleware:
+    """Per-user / per-IP inbound rate limiting, answering 429 with Retry-After"""
+
+    def __init__(self, app, backend=None):
+        self.app = app
+        if backend is None:
+            backend = RedisBackend(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else InMemoryBackend()
+        self.backend = backend
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or path in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        budget = "upstream" if path.startswith(UPSTREAM_PREFIXES) else "db"
+        for kind, identity in _client_identities(Headers(scope=scope), scope):
+            limit = BUDGETS[budget][kind]
+            retry_after = await self.backend.hit(f"{budget}:{kind}:{identity}", limit, RATE_LIMIT_WINDOW)
+            if retry_after:
+                break
+
+        if retry_after:
+            metrics.RATE_LIMITED.inc(budget, kind)
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
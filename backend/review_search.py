@@ -0,0 +1,134 @@
+from sqlalchemy import delete, func, insert, literal_column, select, text, column, table
+from sqlalchemy.exc import OperationalError
+import logging
+import re
+
+from database import Rating, User
+
+logger = logging.getLogger(__name__)
+
+# Postgres: a partial GIN expression index, which the database keeps current
+# on every insert/update/delete. Queries must repeat DOCUMENT verbatim for
+# the planner to use it.
+DOCUMENT = "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(review, ''))"
+HAS_REVIEW = "review IS NOT NULL AND review <> ''"
+POSTGRES_INDEX = (
+    f"CREATE INDEX IF NOT EXISTS ix_ratings_review_search ON ratings USING GIN ({DOCUMENT}) WHERE {HAS_REVIEW}"
+)
+
+# SQLite: an FTS5 table keyed by rating id, updated by the rating write paths
+FTS_TABLE = "ratings_search"
+SQLITE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, review, tokenize='porter unicode61')"
+)
+fts = table(FTS_TABLE, column("rowid"), column("title"), column("review"))
+
+_fts_ready = {}  # engine url -> whether the FTS table exists
+
+
+def create_search_index(engine):
+    """Create the dialect's review index; a new FTS table is filled from ratings"""
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(POSTGRES_INDEX))
+        elif engine.dialect.name == "sqlite":
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": FTS_TABLE}
+            ).first()
+            conn.execute(text(SQLITE_TABLE))
+            if not exists:
+                _fill(conn)
+    _fts_ready.pop(str(engine.url), None)
+
+
+def _fill(conn):
+    conn.execute(insert(fts).from_select(
+        ["rowid", "title", "review"],
+        select(Rating.id, Rating.title, Rating.review).where(text(HAS_REVIEW))
+    ))
+
+
+def rebuild(db):
+    """Re-fill the SQLite FTS table from ratings, after bulk loads; Postgres needs nothing"""
+    if not _uses_fts(db):
+        return
+    db.execute(delete(fts))
+    _fill(db)
+    db.commit()
+
+
+def _uses_fts(db):
+    bind = db.get_bind()
+    if bind.dialect.name != "sqlite":
+        return False
+    key = str(bind.url)
+    if key not in _fts_ready:
+        _fts_ready[key] = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": FTS_TABLE}
+        ).first() is not None
+        if not _fts_ready[key]:
+            logger.warning("%s is missing; review search is disabled until manage.py init-db runs", FTS_TABLE)
+    return _fts_ready[key]
+
+
+def index_rating(db, rating):
+    """Refresh rating's search entry inside the caller's transaction"""
+    if not _uses_fts(db):
+        return
+    db.execute(delete(fts).where(fts.c.rowid == rating.id))
+    if rating.review:
+        db.execute(insert(fts).values(rowid=rating.id, title=rating.title, review=rating.review))
+
+
+def unindex_ratings(db, rating_ids):
+    if rating_ids and _uses_fts(db):
+        db.execute(delete(fts).where(fts.c.rowid.in_(rating_ids)))
+
+
+def _fts_query(q):
+    """FTS5 MATCH expression for free text: every word required, the last as a prefix"""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(db, q, content_type=None, min_rating=None, limit=20, offset=0):
+    """Ratings with a review matching q, best match first.
+
+    Returns (rows, has_more); rows are (Rating, username).
+    """
+    query = db.query(Rating, User.username).join(User, User.id == Rating.user_id)
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        tsquery = func.websearch_to_tsquery("english", q)
+        document = literal_column(DOCUMENT)
+        query = query.filter(text(HAS_REVIEW), document.op("@@")(tsquery)).order_by(
+            func.ts_rank(document, tsquery).desc(), Rating.rated_at.desc()
+        )
+    elif _uses_fts(db):
+        match = _fts_query(q)
+        if match is None:
+            return [], False
+        query = query.join(fts, fts.c.rowid == Rating.id).filter(
+            literal_column(FTS_TABLE).op("MATCH")(match)
+        ).order_by(func.bm25(literal_column(FTS_TABLE)), Rating.rated_at.desc())
+    else:
+        return [], False
+
+    if content_type:
+        query = query.filter(Rating.content_type == content_type)
+    if min_rating is not None:
+        query = query.filter(Rating.rating >= min_rating)
+    try:
+        rows = query.offset(offset).limit(limit + 1).all()
+    except OperationalError:
+        if dialect == "postgresql":
+            raise
+        # FTS5 rejects a few inputs even after quoting; treat them as no match
+        db.rollback()
+        logger.warning("Review search failed for %r", q, exc_info=True)
+        return [], False
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,137 @@
+import fcntl
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+import account_deletion
+import catalog
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Turns cache warming on or off; account deletions have their own flag
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", os.path.join(tempfile.gettempdir(), "mediamingle-scheduler.lock"))
+WARM_TOP_N = int(os.getenv("WARM_TOP_N", "10"))
+
+REFRESH_AT = 0.8  # re-fetch once this fraction of a TTL has passed
+JITTER = 0.1  # +/- fraction applied to every interval
+LEADER_RETRY_SECONDS = 30
+
+
+class Job:
+    def __init__(self, name, interval, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.next_run = 0.0  # run at boot
+
+
+class Scheduler:
+    """Runs periodic jobs in a background thread.
+
+    With several uvicorn workers only the one holding an exclusive flock on
+    LOCK_PATH runs jobs; the others retry every LEADER_RETRY_SECONDS so a
+    replacement takes over if the leader exits.
+    """
+
+    def __init__(self, lock_path=LOCK_PATH):
+        self.lock_path = lock_path
+        self.jobs = []
+        self._lock_file = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add_job(self, name, interval, fn):
+        self.jobs.append(Job(name, interval, fn))
+
+    def _acquire_leadership(self):
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run_job(self, job):
+        start = time.perf_counter()
+        result = "ok"
+        try:
+            job.fn()
+        except Exception:
+            result = "error"
+            logger.exception("Scheduled job %s failed", job.name)
+        finally:
+            metrics.SCHEDULER_JOB_DURATION.observe(time.perf_counter() - start, job.name)
+            metrics.SCHEDULER_JOB_RUNS.inc(job.name, result)
+            job.next_run = time.monotonic() + job.interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if self._lock_file is None and not self._acquire_leadership():
+                self._stopped.wait(LEADER_RETRY_SECONDS)
+                continue
+
+            for job in self.jobs:
+                if self._stopped.is_set():
+                    return
+                if job.next_run <= time.monotonic():
+                    self._run_job(job)
+
+            next_run = min(job.next_run for job in self.jobs)
+            self._stopped.wait(max(0.0, next_run - time.monotonic()))
+
+    def start(self):
+        if self._thread is None and self.jobs:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+# ====================== CACHE WARMING ======================
+
+def _top_ids(content_type):
+    payload = catalog.trending(content_type)
+    if content_type == "anime":
+        return [item["mal_id"] for item in payload.get("data", [])[:WARM_TOP_N]]
+    return [item["id"] for item in payload.get("results", [])[:WARM_TOP_N]]
+
+
+def warm_top_details():
+    for content_type in ("movies", "tv", "anime"):
+        for content_id in _top_ids(content_type):
+            catalog.details(content_type, content_id, refresh=True)
+
+
+def warm_genres():
+    catalog.genres("movie", refresh=True)
+    catalog.genres("tv", refresh=True)
+
+
+scheduler = Scheduler()
+
+if SCHEDULER_ENABLED:
+    for content_type in ("movies", "tv", "anime"):
+        scheduler.add_job(
+            f"trending-{content_type}", catalog.TRENDING_TTL * REFRESH_AT,
+            lambda content_type=content_type: catalog.trending(content_type, refresh=True)
+        )
+    scheduler.add_job("genres", catalog.GENRES_TTL * REFRESH_AT, warm_genres)
+    scheduler.add_job("top-details", catalog.DETAIL_TTL * REFRESH_AT, warm_top_details)
+
+if account_deletion.ENABLED:
+    scheduler.add_job("account-deletions", account_deletion.INTERVAL, account_deletion.run_pending)
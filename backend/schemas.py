@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Optional
 from datetime import datetime
 
 # ====================== USER SCHEMAS ======================
@@ -72,7 +72,7 @@ class HistoryCreate(BaseModel):
     poster_url: Optional[str] = None
 
 class HistoryResponse(BaseModel):
-    id: int
+    id: Optional[int] = None  # None until the buffered view is flushed
     content_type: str
     content_id: str
     title: str
@@ -107,6 +107,42 @@ class RatingResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ReviewSearchResult(RatingResponse):
+    username: str
+
+
+class ReviewSearchPage(BaseModel):
+    results: List[ReviewSearchResult]
+    page: int
+    has_next_page: bool
+
+# ====================== LIBRARY SCHEMAS ======================
+
+LIBRARY_STATUS_MAX_ITEMS = 100
+
+class LibraryItem(BaseModel):
+    content_type: str
+    content_id: str
+
+class LibraryStatusRequest(BaseModel):
+    items: List[LibraryItem] = Field(max_length=LIBRARY_STATUS_MAX_ITEMS)
+
+class ContentStatsResponse(BaseModel):
+    count: int
+    average: Optional[float] = None
+    histogram: List[int]
+
+class LibraryStatus(BaseModel):
+    content_type: str
+    content_id: str
+    is_favorite: bool
+    favorite_id: Optional[int] = None
+    has_rating: bool
+    rating: Optional[float] = None
+    rating_id: Optional[int] = None
+    last_viewed_at: Optional[datetime] = None
+    community: Optional[ContentStatsResponse] = None
+
 # ====================== NEW: SOCIAL SCHEMAS ======================
 
 class FollowResponse(BaseModel):
@@ -124,6 +160,7 @@ class FollowerDetail(BaseModel):
     avatar_url: Optional[str] = None
     bio: Optional[str] = None
     followed_at: datetime
+    taste_match: Optional[int] = None  # only with sort=taste
 
     class Config:
         from_attributes = True
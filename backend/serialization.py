@@ -0,0 +1,21 @@
+from fastapi.responses import ORJSONResponse
+
+# Large list routes select just the response columns as tuples and encode
+# them with orjson. Returning a Response directly also skips FastAPI's
+# per-row response_model re-validation; response_model stays on the route
+# for the OpenAPI schema.
+
+
+def response_fields(schema):
+    """Field names of a response schema, in declaration order"""
+    return tuple(schema.model_fields)
+
+
+def columns(model, fields, overrides=None):
+    """Model columns for fields; overrides maps a field to another column"""
+    overrides = overrides or {}
+    return [overrides[f] if f in overrides else getattr(model, f) for f in fields]
+
+
+def rows_response(rows, fields):
+    return ORJSONResponse([dict(zip(fields, row)) for row in rows])
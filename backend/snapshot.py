@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog_snapshot.json.gz"))
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "600"))  # seconds between saves
+# Serve the snapshot if upstream takes longer than this; the live answer still refreshes it
+UPSTREAM_LATENCY_BUDGET = float(os.getenv("UPSTREAM_LATENCY_BUDGET", "3.0"))
+MAX_DETAIL_RECORDS = int(os.getenv("SNAPSHOT_MAX_DETAILS", "300"))
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="snapshot-fetch")
+
+
+class SnapshotStore:
+    """Last known good upstream payloads, persisted to a gzipped JSON file.
+
+    List payloads (trending, genres, mood pools) are kept indefinitely;
+    detail records are kept for the MAX_DETAIL_RECORDS most recently served
+    titles.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self._lists = {}
+        self._details = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._lists.get(key) or self._details.get(key)
+            if key in self._details:
+                self._details.move_to_end(key)
+            return entry
+
+    def put(self, key, payload, detail=False):
+        entry = {"payload": payload, "saved_at": time.time()}
+        with self._lock:
+            if detail:
+                self._details[key] = entry
+                self._details.move_to_end(key)
+                while len(self._details) > MAX_DETAIL_RECORDS:
+                    self._details.popitem(last=False)
+            else:
+                self._lists[key] = entry
+            self._dirty = True
+
+    def load(self):
+        """Read the snapshot file if present; returns the number of records"""
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError):
+            logger.exception("Ignoring unreadable snapshot %s", self.path)
+            return 0
+        with self._lock:
+            self._lists = data.get("lists", {})
+            self._details = OrderedDict(data.get("details", []))
+        return len(self._lists) + len(self._details)
+
+    def save(self):
+        """Atomically write the snapshot if anything changed"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = {"lists": dict(self._lists), "details": list(self._details.items())}
+            self._dirty = False
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.exception("Failed to write snapshot %s", self.path)
+            with self._lock:
+                self._dirty = True
+            return False
+        return True
+
+    def _run(self):
+        while not self._stopped.wait(SNAPSHOT_INTERVAL):
+            self.save()
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="snapshot-save", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+
+snapshots = SnapshotStore()
+
+
+def _stale(entry):
+    payload = dict(entry["payload"])
+    payload["stale"] = True
+    payload["snapshot_at"] = datetime.utcfromtimestamp(entry["saved_at"]).isoformat()
+    return payload
+
+
+def _remember(key, response, detail, on_fresh):
+    if response.status_code == 200:
+        payload = response.json()
+        snapshots.put(key, payload, detail)
+        if on_fresh is not None:
+            on_fresh(payload)
+        return payload
+    return None
+
+
+def serve_with_snapshot(key, fetch, detail=False, on_fresh=None):
+    """Return fresh upstream JSON, falling back to the snapshot for key.
+
+    fetch performs the upstream call and returns a requests.Response. When a
+    snapshot exists the call is bounded by UPSTREAM_LATENCY_BUDGET; errors,
+    non-200 answers and slow calls are answered from the snapshot with
+    "stale": true added to the body. on_fresh is called with every good
+    upstream payload, including one that arrives after the budget ran out.
+    """
+    entry = snapshots.get(key)
+    if entry is None:
+        response = fetch()
+        payload = _remember(key, response, detail, on_fresh)
+        return payload if payload is not None else response.json()
+
+    future = _executor.submit(fetch)
+    try:
+        response = future.result(timeout=UPSTREAM_LATENCY_BUDGET)
+    except TimeoutError:
+        # Let the slow call finish in the background so the next request is fresh
+        future.add_done_callback(
+            lambda f: f.exception() is None and _remember(key, f.result(), detail, on_fresh)
+        )
+        return _stale(entry)
+    except (requests.RequestException, ValueError):
+        return _stale(entry)
+
+    try:
+        payload = _remember(key, response, detail, on_fresh)
+    except ValueError:
+        payload = None
+    return payload if payload is not None else _stale(entry)
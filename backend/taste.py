@@ -0,0 +1,117 @@
+import os
+import threading
+
+import numpy as np
+
+from cache import TTLCache
+from database import Rating
+
+# Fewer co-rated titles than this and there is no meaningful match
+MIN_CO_RATED = int(os.getenv("TASTE_MIN_CO_RATED", "3"))
+VECTOR_TTL = float(os.getenv("TASTE_VECTOR_TTL", "300"))  # other workers' rating writes show up after this
+VECTOR_CACHE_USERS = int(os.getenv("TASTE_VECTOR_CACHE_USERS", "20000"))
+MAX_DIFFERENCE = 9.0  # ratings run 1-10
+
+_vectors = TTLCache("taste_vectors", max_entries=VECTOR_CACHE_USERS)
+
+# Dense int ids for (content_type, content_id), shared by every vector
+_item_ids = {}
+_item_ids_lock = threading.Lock()
+
+EMPTY = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+
+
+def _item_id(key):
+    item_id = _item_ids.get(key)
+    if item_id is None:
+        with _item_ids_lock:
+            item_id = _item_ids.setdefault(key, len(_item_ids))
+    return item_id
+
+
+def _vector(rows):
+    """(sorted item ids, scores) from (content_type, content_id, rating) rows"""
+    rows = [row for row in rows if row[2] is not None]
+    if not rows:
+        return EMPTY
+    ids = np.fromiter((_item_id((row[0], row[1])) for row in rows), dtype=np.int32, count=len(rows))
+    scores = np.fromiter((row[2] for row in rows), dtype=np.float32, count=len(rows))
+    order = np.argsort(ids)
+    return ids[order], scores[order]
+
+
+def vectors(db, user_ids):
+    """{user_id: (ids, scores)}, loading every uncached user in one query"""
+    found, missing = {}, []
+    for user_id in user_ids:
+        vector = _vectors.get(user_id)
+        if vector is None:
+            missing.append(user_id)
+        else:
+            found[user_id] = vector
+    if missing:
+        rows_by_user = {user_id: [] for user_id in missing}
+        rows = db.query(Rating.user_id, Rating.content_type, Rating.content_id, Rating.rating).filter(
+            Rating.user_id.in_(missing)
+        ).all()
+        for user_id, content_type, content_id, rating in rows:
+            rows_by_user[user_id].append((content_type, content_id, rating))
+        for user_id, user_rows in rows_by_user.items():
+            found[user_id] = _vector(user_rows)
+            _vectors.set(user_id, found[user_id], VECTOR_TTL)
+    return found
+
+
+def invalidate(user_id):
+    """Drop a cached vector after the user's ratings change"""
+    _vectors.pop(user_id)
+
+
+def _percent(count, difference_sum):
+    if count < MIN_CO_RATED:
+        return None
+    return int(round(100 * (1 - difference_sum / count / MAX_DIFFERENCE)))
+
+
+def match(viewer, other):
+    """{"match": percent or None, "co_rated": n} for two (ids, scores) vectors.
+
+    The match is 100% minus the mean rating gap on titles both rated, so
+    identical scores give 100 and opposite ends of the scale give 0.
+    """
+    ids_a, scores_a = viewer
+    ids_b, scores_b = other
+    _, in_a, in_b = np.intersect1d(ids_a, ids_b, assume_unique=True, return_indices=True)
+    count = len(in_a)
+    difference_sum = float(np.abs(scores_a[in_a] - scores_b[in_b]).sum()) if count else 0.0
+    return {"match": _percent(count, difference_sum), "co_rated": count}
+
+
+def match_many(viewer, others):
+    """match() of viewer against every vector in others ({user_id: vector}) at once.
+
+    All other vectors are concatenated and looked up in the viewer's sorted
+    ids with one searchsorted; per-user sums come from bincount.
+    """
+    if not others:
+        return {}
+    user_ids = list(others)
+    ids_v, scores_v = viewer
+    lengths = np.fromiter((len(others[u][0]) for u in user_ids), dtype=np.int64, count=len(user_ids))
+    owners = np.repeat(np.arange(len(user_ids)), lengths)
+    ids = np.concatenate([others[u][0] for u in user_ids]) if lengths.sum() else EMPTY[0]
+    scores = np.concatenate([others[u][1] for u in user_ids]) if lengths.sum() else EMPTY[1]
+
+    if len(ids_v) and len(ids):
+        positions = np.minimum(np.searchsorted(ids_v, ids), len(ids_v) - 1)
+        hit = ids_v[positions] == ids
+    else:
+        positions, hit = np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+    counts = np.bincount(owners[hit], minlength=len(user_ids))
+    differences = np.bincount(
+        owners[hit], weights=np.abs(scores_v[positions[hit]] - scores[hit]), minlength=len(user_ids)
+    )
+    return {
+        user_id: {"match": _percent(int(counts[i]), float(differences[i])), "co_rated": int(counts[i])}
+        for i, user_id in enumerate(user_ids)
+    }
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+
+# Modules read their settings at import time; keep tests off shared files.
+# A file rather than sqlite:// so background threads see the same database.
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='mediamingle-tests-'), 'test.db')}")
+os.environ.setdefault("CACHE_L2_PATH", "")
+os.environ.setdefault("SCHEDULER_ENABLED", "0")
+os.environ.setdefault("ACCOUNT_DELETION_ENABLED", "0")
+os.environ.setdefault("DISCOVER_PREFETCH", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Session on an empty schema; every table is emptied afterwards"""
+    database.init_db()
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        with database.get_engine().begin() as conn:
+            for table in reversed(database.Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+            conn.execute(text("DELETE FROM ratings_search"))
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user(name):
+        user = database.User(email=f"{name}@example.com", username=name, hashed_password="x")
+        db.add(user)
+        db.commit()
+        return user
+    return make_user
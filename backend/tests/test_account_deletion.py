@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import func
+
+import account_deletion
+import content_stats
+from database import AccountDeletion, Activity, ContentStats, Favorite, Follow, History, Rating, User
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(account_deletion, "BATCH_SIZE", 2)
+    monkeypatch.setattr(account_deletion, "PAUSE_SECONDS", 0)
+
+
+def rate(db, user, content_id, value):
+    db.add(Rating(user_id=user.id, content_type="movies", content_id=content_id, title="T", rating=value))
+    content_stats.apply_rating_change(db, "movies", content_id, new=value)
+
+
+def populate(db, user, other):
+    for i in range(5):
+        rate(db, user, str(i), 4.0 + i)
+        db.add(Favorite(user_id=user.id, content_type="tv", content_id=str(i), title="T"))
+        db.add(History(user_id=user.id, content_type="anime", content_id=str(i), title="T"))
+    rate(db, other, "0", 9.0)
+    db.add(Follow(follower_id=user.id, following_id=other.id))
+    db.add(Follow(follower_id=other.id, following_id=user.id))
+    db.add(Activity(user_id=user.id, activity_type="favorite", content_type="tv", content_id="1"))
+    db.add(Activity(user_id=other.id, activity_type="follow", target_user_id=user.id))
+    db.add(Activity(user_id=other.id, activity_type="rating", content_type="movies", content_id="0"))
+    db.commit()
+
+
+def stats(db):
+    return {
+        (row.content_type, row.content_id): (row.rating_count, row.rating_sum)
+        for row in db.query(ContentStats).filter(ContentStats.rating_count > 0)
+    }
+
+
+def test_deletion_removes_every_row_in_batches(db, make_user):
+    user, other = make_user("leaving"), make_user("staying")
+    populate(db, user, other)
+    user_id = user.id
+
+    job = account_deletion.request_deletion(db, user)
+    assert job.total_rows == 5 * 3 + 2 + 2
+    assert user.username.startswith("deleted-") and user.hashed_password == ""
+
+    account_deletion.run_pending(budget=60)
+    db.expire_all()
+    job = db.get(AccountDeletion, job.id)
+    assert job.status == "done" and job.deleted_rows == job.total_rows
+    assert account_deletion.progress(job)["percent"] == 100.0
+    assert db.get(User, user_id) is None
+    for model, column in ((Rating, Rating.user_id), (Favorite, Favorite.user_id), (History, History.user_id)):
+        assert db.query(func.count(model.id)).filter(column == user_id).scalar() == 0
+    assert db.query(Follow).count() == 0
+    assert [a.user_id for a in db.query(Activity)] == [other.id]
+
+    # Community stats lost exactly the deleted user's ratings
+    assert stats(db) == {("movies", "0"): (1, 9.0)}
+    content_stats.recompute(db)
+    assert stats(db) == {("movies", "0"): (1, 9.0)}
+
+
+def test_deletion_resumes_after_running_out_of_time(db, make_user):
+    user, other = make_user("slow"), make_user("other")
+    populate(db, user, other)
+    job = account_deletion.request_deletion(db, user)
+
+    account_deletion.run_pending(budget=0)
+    db.expire_all()
+    assert db.get(AccountDeletion, job.id).status == "running"
+
+    account_deletion.run_pending(budget=60)
+    db.expire_all()
+    assert db.get(AccountDeletion, job.id).status == "done"
+
+
+def test_requesting_twice_returns_the_same_job(db, make_user):
+    user = make_user("twice")
+    first = account_deletion.request_deletion(db, user)
+    assert account_deletion.request_deletion(db, user).id == first.id
+
+
+def test_tombstone_name_cannot_be_taken_in_advance(db, make_user):
+    victim = make_user("victim")
+    make_user(f"deleted-{victim.id}")
+    job = account_deletion.request_deletion(db, victim)
+    assert victim.username == f"deleted-{job.id}"
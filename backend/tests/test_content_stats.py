@@ -0,0 +1,62 @@
+import random
+
+from content_stats import apply_rating_change, bucket_of, recompute, stats_for, stats_for_many
+from database import ContentStats, Rating
+
+
+def snapshot(db):
+    db.expire_all()
+    return {
+        (row.content_type, row.content_id): (
+            row.rating_count, row.rating_sum, tuple(getattr(row, f"b{i}") for i in range(1, 11))
+        )
+        for row in db.query(ContentStats).filter(ContentStats.rating_count > 0)
+    }
+
+
+def test_buckets():
+    assert [bucket_of(value) for value in (1, 1.5, 2, 9.9, 10)] == [1, 1, 2, 9, 10]
+
+
+def test_incremental_updates_match_recompute(db, make_user):
+    rng = random.Random(44)
+    users = [make_user(f"rater{i}") for i in range(6)]
+    titles = [("movies", "1"), ("movies", "2"), ("tv", "1"), ("anime", "9")]
+    ratings = {}  # (user_id, title) -> Rating
+
+    for _ in range(300):
+        user, title = rng.choice(users), rng.choice(titles)
+        existing = ratings.get((user.id, title))
+        value = rng.randint(2, 20) / 2  # halves keep the sums exact
+        if existing is None:
+            existing = Rating(user_id=user.id, content_type=title[0], content_id=title[1], title="T", rating=value)
+            db.add(existing)
+            ratings[(user.id, title)] = existing
+            apply_rating_change(db, *title, new=value)
+        elif rng.random() < 0.3:
+            db.delete(existing)
+            del ratings[(user.id, title)]
+            apply_rating_change(db, *title, old=existing.rating)
+        else:
+            apply_rating_change(db, *title, old=existing.rating, new=value)
+            existing.rating = value
+        db.commit()
+
+    incremental = snapshot(db)
+    assert len(incremental) == len(titles)
+    assert recompute(db) == len(incremental)
+    assert snapshot(db) == incremental
+
+
+def test_stats_dicts(db):
+    apply_rating_change(db, "movies", "1", new=8.0)
+    apply_rating_change(db, "movies", "1", new=5.0)
+    apply_rating_change(db, "movies", "1", old=5.0, new=6.0)
+    db.commit()
+
+    assert stats_for(db, "movies", "1") == {
+        "count": 2, "average": 7.0, "histogram": [0, 0, 0, 0, 0, 1, 0, 1, 0, 0]
+    }
+    assert stats_for_many(db, [("movies", "1"), ("tv", "1")])[("tv", "1")] == {
+        "count": 0, "average": None, "histogram": [0] * 10
+    }
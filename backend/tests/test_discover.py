@@ -0,0 +1,85 @@
+import itertools
+
+import pytest
+
+import discover
+
+_keys = itertools.count()
+
+
+def source(total, page_size, keep=lambda item: True):
+    """DiscoverSource over total numbered items, served page_size at a time"""
+    fetched = []
+
+    def upstream_page(number):
+        fetched.append(number)
+        start = (number - 1) * page_size
+        return {
+            "data": [{"mal_id": i} for i in range(start, min(start + page_size, total))],
+            "more": start + page_size < total,
+        }
+
+    result = discover.DiscoverSource(
+        f"test:{next(_keys)}", None, lambda payload: payload["data"],
+        lambda payload, number: payload["more"], keep, page_size=page_size
+    )
+    result.upstream_page = upstream_page
+    result.fetched = fetched
+    return result
+
+
+def ids(items):
+    return [item["mal_id"] for item in items]
+
+
+def test_pages_are_contiguous():
+    listing = source(100, 25)
+    pages = [discover.get_page(listing, page) for page in range(1, 6)]
+    assert [ids(items) for items, _ in pages] == [list(range(n, n + 20)) for n in range(0, 100, 20)]
+    assert [has_next for _, has_next in pages] == [True, True, True, True, False]
+
+
+def test_paging_forward_reuses_cursors():
+    listing = source(1000, 25)
+    discover.get_page(listing, 1)
+    listing.fetched.clear()
+    discover.get_page(listing, 2)
+    assert listing.fetched == [1, 2]  # starts from page 1's end, no walk from the start
+
+
+@pytest.mark.parametrize("page_size", [20, 25, 30])
+def test_cold_jump_matches_a_sequential_walk(page_size):
+    page = discover.MAX_SCAN_PAGES + 5
+    walked = source(2000, page_size)
+    for number in range(1, page + 1):
+        items, _ = discover.get_page(walked, number)
+
+    jumped = source(2000, page_size)
+    assert ids(discover.get_page(jumped, page)[0]) == ids(items)
+    assert len(jumped.fetched) <= 2
+
+
+def test_sparse_filter_fills_every_page_but_the_last():
+    listing = source(1000, 25, keep=lambda item: item["mal_id"] % 13 == 0)
+    pages, page = [], 1
+    while True:
+        items, has_next = discover.get_page(listing, page)
+        pages.append(ids(items))
+        if not has_next:
+            break
+        page += 1
+    assert [len(items) for items in pages[:-1]] == [20] * (len(pages) - 1)
+    assert sum(pages, []) == list(range(0, 1000, 13))
+
+
+def test_exact_fill_at_the_end_has_no_next_page():
+    items, has_next = discover.get_page(source(40, 20), 2)
+    assert len(items) == 20 and not has_next
+
+
+def test_fill_stops_after_max_fill_pages(monkeypatch):
+    monkeypatch.setattr(discover, "MAX_FILL_PAGES", 3)
+    listing = source(10000, 25, keep=lambda item: item["mal_id"] % 50 == 0)
+    items, has_next = discover.get_page(listing, 1)
+    assert ids(items) == [0, 50] and not has_next
+    assert listing.fetched == [1, 2, 3]
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import history_buffer as history_module
+from database import History, LibraryChange, SessionLocal
+from history_buffer import HistoryBuffer
+
+
+def failing_session():
+    raise RuntimeError("database is down")
+
+
+def rows(db, user):
+    db.expire_all()
+    return db.query(History).filter(History.user_id == user.id).order_by(History.id).all()
+
+
+def test_flush_writes_queued_views_and_logs_library_changes(db, make_user):
+    user = make_user("viewer")
+    buffer = HistoryBuffer()
+    buffer.add(user.id, "movies", "1", "One", None)
+    buffer.add(user.id, "tv", "2", "Two", "poster.jpg")
+    buffer.add(user.id, "movies", "1", "One", None)  # coalesced with the first view
+
+    assert buffer.flush() == 2
+    assert [(row.content_type, row.content_id) for row in rows(db, user)] == [("movies", "1"), ("tv", "2")]
+    changes = db.query(LibraryChange.version, LibraryChange.op).filter(LibraryChange.user_id == user.id).all()
+    assert changes == [(1, "upsert"), (1, "upsert")]  # one version for the whole batch
+    assert buffer.flush() == 0
+
+
+def test_repeat_view_within_a_day_bumps_the_stored_row(db, make_user):
+    user = make_user("repeat")
+    db.add(History(user_id=user.id, content_type="movies", content_id="1", title="One",
+                   viewed_at=datetime.utcnow() - timedelta(hours=2)))
+    db.commit()
+
+    buffer = HistoryBuffer()
+    entry = buffer.add(user.id, "movies", "1", "One", None)
+    buffer.flush()
+    stored = rows(db, user)
+    assert len(stored) == 1
+    assert stored[0].viewed_at == entry["viewed_at"]
+
+
+def test_view_after_a_day_adds_a_row(db, make_user):
+    user = make_user("returning")
+    db.add(History(user_id=user.id, content_type="movies", content_id="1", title="One",
+                   viewed_at=datetime.utcnow() - timedelta(hours=25)))
+    db.commit()
+
+    buffer = HistoryBuffer()
+    buffer.add(user.id, "movies", "1", "One", None)
+    buffer.flush()
+    assert len(rows(db, user)) == 2
+
+
+def test_full_buffer_drops_new_views_but_coalesces_repeats(monkeypatch):
+    monkeypatch.setattr(history_module, "MAX_PENDING", 3)
+    buffer = HistoryBuffer(session_factory=failing_session)
+    for content_id in "abcde":
+        buffer.add(1, "movies", content_id, content_id, None)
+    buffer.add(1, "movies", "a", "renamed", None)
+
+    pending = {entry["content_id"]: entry["title"] for entry in buffer.pending_entries(1)}
+    assert pending == {"a": "renamed", "b": "b", "c": "c"}
+
+
+def test_failed_flush_keeps_views_and_backs_off(db, make_user):
+    user = make_user("retry")
+    buffer = HistoryBuffer(session_factory=failing_session)
+    buffer.add(user.id, "movies", "1", "One", None)
+
+    assert buffer.flush() == 0
+    assert buffer.flush() == 0
+    assert len(buffer.pending_entries(user.id)) == 1
+    assert buffer._retry_interval() == pytest.approx(history_module.FLUSH_INTERVAL * 4)
+
+    # Adding while backing off does not write on the caller's thread
+    buffer.add(user.id, "movies", "2", "Two", None)
+    assert rows(db, user) == []
+
+    buffer._session_factory = SessionLocal
+    assert buffer.flush() == 2
+    assert buffer._retry_interval() == history_module.FLUSH_INTERVAL
+    assert len(rows(db, user)) == 2
+
+
+def test_discard_user_drops_only_their_views():
+    buffer = HistoryBuffer(session_factory=failing_session)
+    buffer.add(1, "movies", "1", "One", None)
+    buffer.add(2, "movies", "1", "One", None)
+    buffer.discard_user(1)
+    assert buffer.pending_entries(1) == []
+    assert len(buffer.pending_entries(2)) == 1
@@ -0,0 +1,59 @@
+import library
+from library import change, changes_since, current_version, record_changes
+
+
+def test_versions_increase_per_user(db, make_user):
+    alice, bob = make_user("alice"), make_user("bob")
+    assert current_version(db, alice.id) == (0, 0)
+    assert [record_changes(db, alice.id, change("favorite", "upsert", "movies", "1")) for _ in range(3)] == [1, 2, 3]
+    assert record_changes(db, bob.id, change("favorite", "upsert", "movies", "1")) == 1
+    db.commit()
+    assert current_version(db, alice.id) == (3, 0)
+
+
+def test_changes_collapse_to_the_latest_per_item(db, make_user):
+    user = make_user("collapse")
+    record_changes(db, user.id, change("favorite", "upsert", "movies", "1", ref_id=10))
+    record_changes(db, user.id, change("rating", "upsert", "tv", "2", ref_id=20, value=7.0))
+    record_changes(db, user.id, change("favorite", "delete", "movies", "1", ref_id=10))
+    record_changes(db, user.id, change("rating", "upsert", "tv", "2", ref_id=20, value=8.5))
+    db.commit()
+
+    result = changes_since(db, user.id, 0)
+    assert result == {"version": 4, "reset": False, "changes": [
+        ["favorite", "delete", "movies", "1", 10, None],
+        ["rating", "upsert", "tv", "2", 20, 8.5],
+    ]}
+    assert changes_since(db, user.id, 3)["changes"] == [["rating", "upsert", "tv", "2", 20, 8.5]]
+    assert changes_since(db, user.id, 4)["changes"] == []
+
+
+def test_history_clear_supersedes_earlier_history(db, make_user):
+    user = make_user("clearer")
+    record_changes(db, user.id, change("history", "upsert", "movies", "1"), change("favorite", "upsert", "tv", "2"))
+    record_changes(db, user.id, change("history", "clear"))
+    record_changes(db, user.id, change("history", "upsert", "anime", "3"))
+    db.commit()
+
+    assert changes_since(db, user.id, 0)["changes"] == [
+        ["favorite", "upsert", "tv", "2", None, None],
+        ["history", "clear", None, None, None, None],
+        ["history", "upsert", "anime", "3", None, None],
+    ]
+
+
+def test_clients_behind_the_pruned_changelog_are_reset(db, make_user, monkeypatch):
+    monkeypatch.setattr(library, "PRUNE_EVERY", 5)
+    monkeypatch.setattr(library, "CHANGELOG_KEEP", 10)
+    user = make_user("pruned")
+    for i in range(20):
+        record_changes(db, user.id, change("favorite", "upsert", "movies", str(i)))
+    db.commit()
+
+    assert current_version(db, user.id) == (20, 10)
+    assert changes_since(db, user.id, 9) == {"version": 20, "reset": True, "changes": []}
+    kept = changes_since(db, user.id, 10)
+    assert not kept["reset"]
+    assert [entry[3] for entry in kept["changes"]] == [str(i) for i in range(10, 20)]
+    # A client claiming a version from the future also starts over
+    assert changes_since(db, user.id, 21)["reset"]
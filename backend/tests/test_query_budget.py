@@ -0,0 +1,82 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import database
+import metrics
+from database import QueryBudgetExceeded, track_queries
+
+
+@pytest.fixture
+def conn():
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        yield connection
+    engine.dispose()
+
+
+def run(conn, count):
+    for _ in range(count):
+        conn.execute(text("SELECT 1"))
+
+
+def test_track_queries_counts_statements(conn):
+    with track_queries() as stats:
+        run(conn, 3)
+        conn.execute(text("SELECT 2"))
+    assert stats.query_count == 4
+    assert stats.statements == {"SELECT 1": 3, "SELECT 2": 1}
+
+    run(conn, 2)  # outside the block nothing is collected
+    assert stats.query_count == 4
+
+
+def test_budget_logs_once_when_exceeded(conn, monkeypatch, caplog):
+    monkeypatch.setattr(database, "QUERY_BUDGET", 2)
+    monkeypatch.setattr(database, "QUERY_BUDGET_STRICT", False)
+    with caplog.at_level(logging.WARNING, logger="database"), track_queries() as stats:
+        run(conn, 5)
+    assert stats.query_count == 5
+    warnings = [r.getMessage() for r in caplog.records if "query budget" in r.getMessage()]
+    assert warnings == ["unknown exceeded its query budget of 2"]
+
+
+def test_budget_within_limit_is_silent(conn, monkeypatch, caplog):
+    monkeypatch.setattr(database, "QUERY_BUDGET", 3)
+    monkeypatch.setattr(database, "QUERY_BUDGET_STRICT", True)
+    with caplog.at_level(logging.WARNING, logger="database"), track_queries():
+        run(conn, 3)
+    assert not [r for r in caplog.records if "query budget" in r.getMessage()]
+
+
+def test_strict_budget_raises_on_the_first_extra_statement(conn, monkeypatch):
+    monkeypatch.setattr(database, "QUERY_BUDGET", 2)
+    monkeypatch.setattr(database, "QUERY_BUDGET_STRICT", True)
+    with track_queries() as stats:
+        run(conn, 2)
+        with pytest.raises(QueryBudgetExceeded, match="budget of 2"):
+            run(conn, 1)
+    assert stats.query_count == 3
+
+
+def test_per_route_budget_overrides_default(conn, monkeypatch):
+    monkeypatch.setattr(database, "QUERY_BUDGET", 0)
+    monkeypatch.setattr(database, "QUERY_BUDGET_STRICT", True)
+    monkeypatch.setattr(database, "QUERY_BUDGETS", {"/feed": 1})
+    stats = metrics.RequestStats({"route": SimpleNamespace(path="/feed")})
+    token = metrics.current_request.set(stats)
+    try:
+        run(conn, 1)
+        with pytest.raises(QueryBudgetExceeded, match="/feed"):
+            run(conn, 1)
+    finally:
+        metrics.current_request.reset(token)
+
+
+def test_repeated_statement_is_reported_as_n_plus_one(conn, monkeypatch, caplog):
+    monkeypatch.setattr(database, "QUERY_BUDGET", 0)
+    with caplog.at_level(logging.WARNING, logger="database"), track_queries():
+        run(conn, database.N_PLUS_ONE_THRESHOLD + 2)
+    assert len([r for r in caplog.records if "Possible N+1" in r.getMessage()]) == 1
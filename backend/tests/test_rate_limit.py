@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import rate_limit
+from auth import create_access_token
+from rate_limit import InMemoryBackend, RateLimitMiddleware, _client_identities, _retry_after
+
+WINDOW = 60
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1000 * WINDOW)  # start exactly on a window boundary
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    return clock
+
+
+def hits(backend, count, limit=10, key="k"):
+    return [asyncio.run(backend.hit(key, limit, WINDOW)) for _ in range(count)]
+
+
+def test_limit_applies_within_a_window(clock):
+    backend = InMemoryBackend()
+    assert hits(backend, 10) == [0] * 10
+    clock.now += 15
+    assert hits(backend, 1) == [WINDOW - 15]
+
+
+def test_previous_window_weight_decays(clock):
+    backend = InMemoryBackend()
+    hits(backend, 10)
+    # Halfway through the next window the previous ten count as five
+    clock.now += WINDOW + WINDOW / 2
+    results = hits(backend, 6)
+    assert results[:5] == [0] * 5
+    assert results[5] > 0
+
+
+def test_counts_reset_after_two_windows(clock):
+    backend = InMemoryBackend()
+    hits(backend, 10)
+    clock.now += 2 * WINDOW
+    assert hits(backend, 10) == [0] * 10
+
+
+def test_keys_are_counted_separately(clock):
+    backend = InMemoryBackend()
+    hits(backend, 10, key="a")
+    assert hits(backend, 1, key="b") == [0]
+
+
+def test_retry_after_is_when_the_next_request_fits(clock):
+    backend = InMemoryBackend()
+    hits(backend, 10)
+    clock.now += WINDOW
+    hits(backend, 5, limit=20)  # five in the current window, without a 429
+    clock.now += WINDOW / 2
+    wait = hits(backend, 1)[0]
+    assert wait == _retry_after(10, 5, 10, WINDOW, WINDOW / 2) == 6
+
+    clock.now += wait - 1
+    assert hits(backend, 1)[0] > 0
+    clock.now += 1
+    assert hits(backend, 1) == [0]
+
+
+def test_client_identities():
+    scope = {"client": ("10.0.0.1", 1234)}
+    assert _client_identities({}, scope) == [("ip", "10.0.0.1")]
+    # The proxy appends the real address last
+    assert _client_identities({"x-forwarded-for": "1.1.1.1, 2.2.2.2"}, scope) == [("ip", "2.2.2.2")]
+    assert _client_identities({"authorization": "Bearer nonsense"}, scope) == [("ip", "10.0.0.1")]
+
+    token = create_access_token({"sub": "a@example.com"})
+    assert _client_identities({"authorization": f"Bearer {token}"}, scope) == [
+        ("user", "a@example.com"), ("ip_users", "10.0.0.1")
+    ]
+
+
+def test_accounts_share_the_ip_budget(monkeypatch):
+    monkeypatch.setitem(rate_limit.BUDGETS, "upstream", {"user": 3, "ip": 2, "ip_users": 5})
+    app = Starlette(routes=[
+        Route("/movie/1", lambda request: PlainTextResponse("ok")),
+        Route("/img", lambda request: PlainTextResponse("ok")),
+    ])
+    client = TestClient(RateLimitMiddleware(app, InMemoryBackend()))
+
+    statuses = []
+    for user in ("a", "b", "c"):
+        headers = {"Authorization": "Bearer " + create_access_token({"sub": f"{user}@example.com"})}
+        statuses += [client.get("/movie/1", headers=headers).status_code for _ in range(3)]
+    assert statuses == [200] * 5 + [429] * 4
+
+    # Anonymous callers have their own counter, and /img is not an upstream route
+    assert [client.get("/movie/1").status_code for _ in range(3)] == [200, 200, 429]
+    assert {client.get("/img").status_code for _ in range(20)} == {200}
@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import database
+
+
+@pytest.fixture
+def broken_replica(tmp_path):
+    replica = database.Replica("broken", f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    replica.get_engine()
+    return replica
+
+
+def test_failed_replica_read_is_retried_on_the_primary(broken_replica):
+    db = broken_replica.sessionmaker()
+    db.info["replica"] = broken_replica
+    try:
+        assert db.execute(text("SELECT 1")).scalar() == 1
+        assert db.get_bind() is database.get_engine()
+    finally:
+        db.close()
+    assert not broken_replica.healthy
+
+
+def test_primary_errors_are_not_retried(broken_replica):
+    db = broken_replica.sessionmaker()  # no replica recorded: nothing to fall back from
+    try:
+        with pytest.raises(OperationalError):
+            db.execute(text("SELECT 1"))
+    finally:
+        db.close()
@@ -0,0 +1,49 @@
+import random
+
+import taste
+
+
+def vector(ratings):
+    """(ids, scores) for {(content_type, content_id): rating}"""
+    return taste._vector([(content_type, content_id, rating) for (content_type, content_id), rating in ratings.items()])
+
+
+def test_identical_ratings_match_fully():
+    ratings = {("movies", str(i)): 7 for i in range(5)}
+    assert taste.match(vector(ratings), vector(ratings)) == {"match": 100, "co_rated": 5}
+
+
+def test_opposite_ratings_do_not_match():
+    low = vector({("movies", str(i)): 1 for i in range(4)})
+    high = vector({("movies", str(i)): 10 for i in range(4)})
+    assert taste.match(low, high) == {"match": 0, "co_rated": 4}
+
+
+def test_too_few_shared_titles_has_no_match():
+    a = vector({("tv", "1"): 8, ("tv", "2"): 8, ("tv", "3"): 8})
+    b = vector({("tv", "1"): 8, ("tv", "2"): 8, ("anime", "3"): 8})
+    assert taste.match(a, b) == {"match": None, "co_rated": 2}
+
+
+def test_unrated_titles_are_ignored():
+    a = vector({("movies", "1"): 6, ("movies", "2"): None, ("movies", "3"): 6, ("movies", "4"): 6})
+    b = vector({("movies", "1"): 6, ("movies", "2"): 6, ("movies", "3"): 6, ("movies", "4"): 6})
+    assert taste.match(a, b)["co_rated"] == 3
+
+
+def test_match_many_agrees_with_match():
+    rng = random.Random(7)
+    titles = [(content_type, str(i)) for content_type in ("movies", "tv", "anime") for i in range(40)]
+
+    def random_vector(size):
+        return vector({title: rng.randint(1, 10) for title in rng.sample(titles, size)})
+
+    viewer = random_vector(30)
+    others = {user_id: random_vector(rng.randint(0, 60)) for user_id in range(50)}
+    others[50] = taste.EMPTY
+
+    assert taste.match_many(viewer, others) == {
+        user_id: taste.match(viewer, other) for user_id, other in others.items()
+    }
+    assert taste.match_many(taste.EMPTY, others)[0] == {"match": None, "co_rated": 0}
+    assert taste.match_many(viewer, {}) == {}
@@ -0,0 +1,292 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import os
+import random
+import threading
+import time
+
+import requests
+
+import metrics
+
+TMDB_API_KEY = os.getenv("TMDB_API_KEY")
+TMDB_BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
+JIKAN_BASE_URL = os.getenv("JIKAN_BASE_URL", "https://api.jikan.moe/v4")
+
+# Jikan allows roughly 3 requests per second; keep calls at least this far apart
+JIKAN_MIN_INTERVAL = float(os.getenv("JIKAN_MIN_INTERVAL", "0.5"))
+
+# (connect, read) seconds for a single attempt
+UPSTREAM_TIMEOUT = (
+    float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("UPSTREAM_READ_TIMEOUT", "8")),
+)
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))  # extra attempts after the first
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.2"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "2.0"))
+# A Retry-After longer than this is not waited out; the 429 goes back to the caller
+UPSTREAM_MAX_RETRY_AFTER = float(os.getenv("UPSTREAM_MAX_RETRY_AFTER", "5"))
+RETRY_STATUSES = {429, 502, 503, 504}
+
+BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))  # consecutive failures to open
+BREAKER_RESET = float(os.getenv("UPSTREAM_BREAKER_RESET", "30"))  # seconds before a probe call
+
+# Hosts whose slow calls get a second, identical request once they pass
+# their recent p95. Jikan is left out by default: hedges would eat into its
+# tight rate limit.
+HEDGE_HOSTS = set(filter(None, os.getenv("UPSTREAM_HEDGE_HOSTS", "tmdb").split(",")))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream-hedge")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    """Shared keep-alive requests.Session, created on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=64)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class RateLimiter:
+    """Spaces calls at least min_interval seconds apart across all threads"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller's slot comes up; returns seconds waited"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+jikan_limiter = RateLimiter(JIKAN_MIN_INTERVAL)
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a host whose circuit breaker is open"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"{host} circuit open")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a host after repeated failures.
+
+    After `failures` consecutive errors or 5xx answers the circuit opens and
+    calls fail fast for `reset_timeout` seconds. Then a single probe call is
+    let through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, host, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.host = host
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failure_count = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        metrics.UPSTREAM_CIRCUIT_STATE.set(self.state, host)
+
+    def _set_state(self, state):
+        self.state = state
+        metrics.UPSTREAM_CIRCUIT_STATE.set(state, self.host)
+
+    def retry_after(self):
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if self.retry_after() > 0:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failure_count = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failure_count += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self._failure_count >= self.failures:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+class LatencyWindow:
+    """Recent call latencies for one host, used to time hedges"""
+
+    def __init__(self, size=256):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95)]
+
+
+breakers = {"tmdb": CircuitBreaker("tmdb"), "jikan": CircuitBreaker("jikan")}
+latencies = {"tmdb": LatencyWindow(), "jikan": LatencyWindow()}
+
+
+def _send(host, url, params):
+    start = time.perf_counter()
+    try:
+        response = http_session().get(url, params=params, timeout=UPSTREAM_TIMEOUT)
+    except requests.RequestException:
+        metrics.UPSTREAM_REQUESTS.inc(host, "error")
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.UPSTREAM_DURATION.observe(elapsed, host)
+    latencies[host].record(elapsed)
+    metrics.UPSTREAM_REQUESTS.inc(host, str(response.status_code))
+    return response
+
+
+def _hedged_send(host, url, params):
+    """Send once; if that outlives the host's p95, race a second copy"""
+    delay = latencies[host].p95() if host in HEDGE_HOSTS else None
+    if delay is None:
+        return _send(host, url, params)
+
+    primary = _hedge_executor.submit(_send, host, url, params)
+    done, _ = wait([primary], timeout=max(delay, HEDGE_MIN_DELAY))
+    if done:
+        return primary.result()
+
+    metrics.UPSTREAM_HEDGES.inc(host, "sent")
+    hedge = _hedge_executor.submit(_send, host, url, params)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    metrics.UPSTREAM_HEDGES.inc(host, "won")
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+
+
+def _retry_after(response):
+    """Seconds from a Retry-After header, None if absent or unparseable"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _get(host, url, params=None, limiter=None):
+    """GET with the host's circuit breaker, bounded retries and hedging.
+
+    Connection errors, timeouts, 502/503/504 and 429 are retried up to
+    UPSTREAM_RETRIES times with jittered backoff; an answer carrying
+    Retry-After waits that long instead, unless it exceeds
+    UPSTREAM_MAX_RETRY_AFTER. Raises CircuitOpenError without calling the
+    host while its breaker is open.
+    """
+    breaker = breakers[host]
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            metrics.UPSTREAM_REQUESTS.inc(host, "circuit_open")
+            raise CircuitOpenError(host, breaker.retry_after())
+        if limiter is not None:
+            metrics.RATE_LIMIT_WAIT.observe(limiter.wait(), host)
+
+        try:
+            response = _hedged_send(host, url, params)
+        except requests.RequestException:
+            breaker.record_failure()
+            if attempt >= UPSTREAM_RETRIES:
+                raise
+            delay, reason = _backoff(attempt), "error"
+        else:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if response.status_code not in RETRY_STATUSES or attempt >= UPSTREAM_RETRIES:
+                return response
+            delay = _retry_after(response)
+            if delay is None:
+                delay = _backoff(attempt)
+            elif delay > UPSTREAM_MAX_RETRY_AFTER:
+                return response
+            reason = str(response.status_code)
+
+        metrics.UPSTREAM_RETRIES.inc(host, reason)
+        time.sleep(delay)
+        attempt += 1
+
+
+def tmdb_get(path, params=None):
+    """GET a TMDB API path, e.g. '/trending/movie/week'"""
+    params = dict(params or {})
+    params["api_key"] = TMDB_API_KEY
+    return _get("tmdb", TMDB_BASE_URL + path, params)
+
+
+def jikan_get(path, params=None):
+    """GET a Jikan API path, honoring the shared rate limit"""
+    return _get("jikan", JIKAN_BASE_URL + path, params, limiter=jikan_limiter)